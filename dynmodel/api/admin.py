@@ -3,3 +3,5 @@ from . import models
 
 admin.site.register(models.DynamicTable)
 admin.site.register(models.DynamicField)
+admin.site.register(models.DynamicIndex)
+admin.site.register(models.DynamicColumnMigration)
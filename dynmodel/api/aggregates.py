@@ -0,0 +1,94 @@
+from django.db import models
+
+from .filters import column_type, parse_filters
+
+# functions over integer columns, 'col__count' and 'col__count_distinct' are allowed for any column
+NUMERIC_FUNCTIONS = {
+    'sum': models.Sum,
+    'min': models.Min,
+    'max': models.Max,
+    'avg': models.Avg,
+}
+
+
+def parse_aggregates(model_cls: models.Model, params) -> dict[str, models.Aggregate]:
+    # 'count' counts rows, 'col__function' aggregates column and is also name of result value
+    aggregates = {}
+
+    for item in (params.get('agg') or 'count').split(','):
+        item = item.strip()
+        if not item:
+            continue
+
+        if item == 'count':
+            aggregates[item] = models.Count('id')
+            continue
+
+        name, _, function = item.partition('__')
+        typ = column_type(model_cls, name)
+
+        if function == 'count':
+            aggregates[item] = models.Count(name)
+        elif function == 'count_distinct':
+            aggregates[item] = models.Count(name, distinct=True)
+        elif function in NUMERIC_FUNCTIONS:
+            if typ != 'i':
+                raise ValueError(f'Function "{function}" is allowed only for integer columns, not "{name}"')
+
+            # avg is numeric on PostgreSQL and float on SQLite, float on both
+            output_field = models.FloatField() if function == 'avg' else None
+            aggregates[item] = NUMERIC_FUNCTIONS[function](name, output_field=output_field)
+        else:
+            raise ValueError(f'Unknown aggregate function "{function}" in "{item}"')
+
+    if not aggregates:
+        raise ValueError('No aggregate function given')
+
+    return aggregates
+
+
+def parse_group_by(model_cls: models.Model, params, aggregates: dict) -> list[str]:
+    group_by = []
+
+    for item in params.get('group_by', '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+
+        column_type(model_cls, item)
+        if item in aggregates:
+            raise ValueError(f'Column "{item}" conflicts with aggregate of the same name')
+
+        group_by.append(item)
+
+    return group_by
+
+
+def parse_result_ordering(params, names: list[str]) -> list[str]:
+    # aggregated rows are sorted by group columns or aggregate values
+    ordering = []
+
+    for item in params.get('ordering', '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+
+        if item.lstrip('-') not in names:
+            raise ValueError(f'Cannot order by "{item}", expected group column or aggregate')
+
+        ordering.append(item)
+
+    return ordering
+
+
+def aggregate_rows(model_cls: models.Model, params) -> list[dict]:
+    # single GROUP BY query, only aggregated values leave the database
+    aggregates = parse_aggregates(model_cls, params)
+    group_by = parse_group_by(model_cls, params, aggregates)
+    ordering = parse_result_ordering(params, group_by + list(aggregates))
+    rows = model_cls.objects.filter(parse_filters(model_cls, params))
+
+    if not group_by:
+        return [rows.aggregate(**aggregates)]
+
+    return list(rows.values(*group_by).annotate(**aggregates).order_by(*(ordering or group_by)))
@@ -1,6 +1,27 @@
+import logging
+
 from django.apps import AppConfig
+from django.conf import settings
+from django.db import DatabaseError
+
+logger = logging.getLogger(__name__)
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        if not settings.DYNAMIC_MODELS['WARM_UP_ON_START']:
+            return
+
+        from .dynamicmodel import DynamicModel
+
+        try:
+            count = DynamicModel.warm_up(register_admin=settings.DYNAMIC_MODELS['REGISTER_MODEL_IN_ADMIN'])
+        except DatabaseError as exc:
+            # e.g. migrate on empty database
+            logger.warning('Dynamic models warm up skipped: %s', exc)
+            return
+
+        logger.info('Warmed up %d dynamic models', count)
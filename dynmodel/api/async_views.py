@@ -0,0 +1,115 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import DatabaseError, IntegrityError
+from django.http import HttpResponse, HttpResponseNotAllowed
+
+from . import views
+from .dynamicmodel import DynamicModel
+from .fastread import plain_columns
+from .filters import filter_rows
+from .groupcommit import group_commit
+from .metrics import ROWS_INSERTED, ROWS_SERIALIZE_SECONDS, ROWS_SERVED
+from .renderers import JSONRenderer
+from .responsecache import not_modified, table_etag
+
+# rows listing with these parameters is left to sync view, under ASGI it answers 'stream' with 501,
+# because Django 4.1 iterates streamed content in event loop, where database can't be queried
+SYNC_LIST_PARAMS = ('stream', 'page_size', 'cursor')
+
+
+def csrf_exempt(view):
+    # decorator of Django 4.1 wraps view in sync function, which would hide coroutine from handler
+    view.csrf_exempt = True
+    return view
+
+
+def json_response(data, status: int = 200) -> HttpResponse:
+    # rendered by the same renderer as sync views, so output doesn't differ
+    return HttpResponse(JSONRenderer().render(data), status=status, content_type='application/json')
+
+
+@csrf_exempt
+async def create_row(request, id):
+    """
+    Async variant of create row for ASGI servers, takes and returns the same data.
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    try:
+        data = json.loads(request.body)
+    except ValueError as exc:
+        return json_response({'detail': f'JSON parse error - {exc}'}, status=400)
+
+    mdl = DynamicModel(id)
+    try:
+        serializer_cls = await mdl.aas_serializer()
+    except ObjectDoesNotExist:
+        return json_response(views.table_not_found_error(id), status=404)
+
+    # validation of dynamic column types doesn't query database
+    serializer = serializer_cls(data=data)
+    if not serializer.is_valid():
+        return json_response({'error': serializer.errors}, status=400)
+
+    if settings.DYNAMIC_MODELS['GROUP_COMMIT']:
+        # waiting for batch blocks thread, so it runs outside of the one thread of sync code
+        try:
+            id = await sync_to_async(group_commit.insert, thread_sensitive=False)(
+                mdl, serializer.validated_data
+            )
+        except DatabaseError as exc:
+            return json_response({'error': {'non_field_errors': [str(exc)]}}, status=400)
+    else:
+        try:
+            id = await sync_to_async(views.save_row)(serializer)
+        except IntegrityError as exc:
+            return json_response({'error': {'non_field_errors': [str(exc)]}}, status=400)
+        await mdl.abump_data_version()
+
+    ROWS_INSERTED.inc()
+
+    return json_response({'id': id}, status=201)
+
+
+@csrf_exempt
+async def table_rows(request, id):
+    """
+    Async variant of rows listing for ASGI servers, filters and ordering work the same.
+    Streaming, pagination, tables which need serializer output and bulk insert (POST)
+    are handled by sync view, streaming (?stream=true) is answered with 501 Not Implemented.
+    """
+    if request.method != 'GET':
+        return await sync_to_async(views.table_rows)(request, id=id)
+
+    mdl = DynamicModel(id)
+    try:
+        model_cls = await mdl.aas_model()
+    except ObjectDoesNotExist:
+        return json_response(views.table_not_found_error(id), status=404)
+
+    columns = plain_columns(model_cls) if settings.DYNAMIC_MODELS['FAST_READ'] else None
+    if not columns or any(param in request.GET for param in SYNC_LIST_PARAMS):
+        return await sync_to_async(views.table_rows)(request, id=id)
+
+    # conditional GET like in sync view, response cache is left to sync view
+    response = not_modified(request, mdl)
+    if response is not None:
+        return response
+
+    try:
+        rows, _ = filter_rows(model_cls, request.GET)
+    except ValueError as exc:
+        return json_response({'error': str(exc)}, status=400)
+
+    with ROWS_SERIALIZE_SECONDS.time():
+        data = [row async for row in rows.values(*columns)]
+    ROWS_SERVED.inc(len(data))
+
+    response = json_response(data)
+    response['ETag'] = table_etag(mdl)
+
+    return response
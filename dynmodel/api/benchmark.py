@@ -0,0 +1,215 @@
+import statistics
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from rest_framework.test import APIRequestFactory
+
+from . import views
+from .bulk import write_rows
+from .cache import model_cache
+from .dynamicmodel import DynamicModel
+
+# column types of generated tables, used in turn
+TYPE_NAMES = ('character', 'integer', 'boolean')
+
+# summary values compared with baseline, latency and query count may grow, throughput may fall
+LOWER_IS_BETTER = ('p50_ms', 'p90_ms', 'queries_per_op')
+HIGHER_IS_BETTER = ('ops_per_sec', 'rows_per_sec')
+
+
+def percentile(samples: list[float], pct: int) -> float:
+    if len(samples) < 2:
+        return samples[0] if samples else 0.0
+
+    return statistics.quantiles(samples, n=100, method='inclusive')[pct - 1]
+
+
+def summarize(samples: list[tuple[float, int, int]], errors: list[str], elapsed: float) -> dict:
+    # samples are (seconds, queries, rows) of every call
+    latencies = [sample[0] * 1000 for sample in samples]
+    rows = sum(sample[2] for sample in samples)
+
+    summary = {
+        'count': len(samples),
+        'errors': len(errors),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p90_ms': round(percentile(latencies, 90), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'max_ms': round(max(latencies, default=0), 3),
+        'ops_per_sec': round(len(samples) / elapsed, 1) if elapsed else 0,
+        'queries_per_op': round(sum(sample[1] for sample in samples) / len(samples), 2) if samples else 0,
+    }
+
+    if rows:
+        summary['rows_per_sec'] = round(rows / elapsed, 1)
+
+    if errors:
+        summary['first_error'] = errors[0]
+
+    return summary
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    # returns regressions, operations or values missing in either run are not compared
+    regressions = []
+
+    for name, current in results['results'].items():
+        previous = baseline.get('results', {}).get(name)
+        if previous is None:
+            continue
+
+        for key in LOWER_IS_BETTER:
+            if previous.get(key) and current.get(key, 0) > previous[key] * (1 + threshold):
+                regressions.append(f'{name}.{key}: {previous[key]} -> {current[key]}')
+
+        for key in HIGHER_IS_BETTER:
+            if previous.get(key) and current.get(key, 0) < previous[key] * (1 - threshold):
+                regressions.append(f'{name}.{key}: {previous[key]} -> {current.get(key, 0)}')
+
+    return regressions
+
+
+class Benchmark:
+    # drives API views and DynamicModel at given scale on current database, every call is timed
+    # and its queries counted; with concurrency > 1 calls run in threads with own connections
+    def __init__(self, tables: int = 10, columns: int = 5, rows: int = 1000, concurrency: int = 1,
+                 single_rows: int = 100):
+        self.tables = tables
+        self.columns = columns
+        self.rows = rows
+        self.concurrency = concurrency
+        self.single_rows = single_rows
+
+        self.factory = APIRequestFactory()
+        self.table_ids = []
+        self._lock = threading.Lock()
+
+    def run(self) -> dict:
+        results = {}
+        results['create_table'] = self.measure(self.create_table, list(range(self.tables)))
+        results['update_table'] = self.measure(self.update_table, self.table_ids)
+
+        single_row_ids = [self.table_ids[i % len(self.table_ids)] for i in range(self.single_rows)]
+        results['create_row'] = self.measure(self.create_row, single_row_ids)
+        # the same inserts coalesced by group commit, they only gain with concurrency
+        with override_settings(DYNAMIC_MODELS=dict(settings.DYNAMIC_MODELS, GROUP_COMMIT=True)):
+            results['create_row_grouped'] = self.measure(self.create_row, single_row_ids)
+        results['insert_rows'] = self.measure(self.insert_rows, self.table_ids)
+
+        results['build_model'] = self.measure(self.build_model, self.table_ids)
+        results['as_model'] = self.measure(self.as_model, self.table_ids)
+        results['list_rows'] = self.measure(self.list_rows, self.table_ids)
+        results['list_page'] = self.measure(self.list_page, self.table_ids)
+        results['search'] = self.measure(self.search, self.table_ids)
+
+        return {
+            'meta': {
+                'vendor': connection.vendor,
+                'tables': self.tables,
+                'columns': self.columns,
+                'rows': self.rows,
+                'concurrency': self.concurrency,
+                'single_rows': self.single_rows,
+            },
+            'results': results,
+        }
+
+    def measure(self, operation, items: list) -> dict:
+        samples = []
+        errors = []
+
+        def work(chunk):
+            try:
+                for item in chunk:
+                    with CaptureQueriesContext(connection) as queries:
+                        started = time.perf_counter()
+                        try:
+                            rows = operation(item)
+                        except Exception as exc:
+                            with self._lock:
+                                errors.append(f'{type(exc).__name__}: {exc}')
+                            continue
+                        elapsed = time.perf_counter() - started
+
+                    with self._lock:
+                        samples.append((elapsed, len(queries), rows or 0))
+            finally:
+                if self.concurrency > 1:
+                    connections.close_all()
+
+        started = time.perf_counter()
+
+        if self.concurrency > 1:
+            threads = [threading.Thread(target=work, args=(items[pos::self.concurrency],))
+                       for pos in range(self.concurrency)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        else:
+            work(items)
+
+        return summarize(samples, errors, time.perf_counter() - started)
+
+    def call(self, view, method: str, url: str, data=None, **kwargs):
+        request = getattr(self.factory, method)(url, data, format='json' if method != 'get' else None)
+        response = view(request, **kwargs)
+
+        if response.status_code >= 400:
+            raise RuntimeError(f'{view.__name__} returned {response.status_code}: {response.data}')
+
+        return response
+
+    def datamodel(self, extra: int = 0) -> dict[str, str]:
+        return {f'col{i}': TYPE_NAMES[i % len(TYPE_NAMES)] for i in range(self.columns + extra)}
+
+    def row(self, number: int) -> dict:
+        values = {'character': f'value{number}', 'integer': number, 'boolean': number % 2 == 0}
+        return {name: values[typ] for name, typ in self.datamodel().items()}
+
+    def create_table(self, _) -> None:
+        datamodel = self.datamodel()
+        datamodel['__search__'] = [name for name, typ in datamodel.items() if typ == 'character']
+        response = self.call(views.create_table, 'post', reverse('create-table'), datamodel)
+
+        with self._lock:
+            self.table_ids.append(response.data['id'])
+
+    def update_table(self, id: int) -> None:
+        self.call(views.update_table, 'put', reverse('update-table', args=[id]), self.datamodel(1), id=id)
+
+    def create_row(self, id: int) -> int:
+        self.call(views.create_row, 'post', reverse('create-row', args=[id]), self.row(id), id=id)
+        return 1
+
+    def insert_rows(self, id: int) -> int:
+        write_rows(DynamicModel(id).as_model(), [self.row(number) for number in range(self.rows)])
+        return self.rows
+
+    def build_model(self, id: int) -> None:
+        model_cache.invalidate(id)
+        DynamicModel(id).as_model()
+
+    def as_model(self, id: int) -> None:
+        DynamicModel(id).as_model()
+
+    def list_rows(self, id: int) -> int:
+        response = self.call(views.table_rows, 'get', reverse('list-rows', args=[id]), id=id)
+        response.render()
+        return len(response.data)
+
+    def list_page(self, id: int) -> int:
+        url = reverse('list-rows', args=[id])
+        response = self.call(views.table_rows, 'get', url, {'page_size': 100}, id=id)
+        response.render()
+        return len(response.data['results'])
+
+    def search(self, id: int) -> int:
+        url = reverse('search-table', args=[id])
+        response = self.call(views.search_table, 'get', url, {'q': f'value{id}'}, id=id)
+        response.render()
+        return len(response.data['results'])
@@ -0,0 +1,128 @@
+import io
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connections, models, router, transaction
+from rest_framework.exceptions import ValidationError
+
+
+def validate_rows(serializer_cls, rows: list) -> tuple[list[tuple[int, dict]], list[dict]]:
+    # one serializer instance for all rows, so field map is built once per batch
+    serializer = serializer_cls()
+    valid = []
+    errors = []
+
+    for index, row in enumerate(rows):
+        try:
+            valid.append((index, serializer.run_validation(row)))
+        except ValidationError as exc:
+            errors.append({'index': index, 'errors': exc.detail})
+
+    return valid, errors
+
+
+def write_rows(model_cls: models.Model, rows: list[dict]) -> list[int]:
+    vendor = connections[router.db_for_write(model_cls)].vendor
+    if vendor == 'postgresql' and settings.DYNAMIC_MODELS['BULK_USE_COPY']:
+        return _copy_rows(model_cls, rows)
+
+    objs = model_cls.objects.bulk_create([model_cls(**row) for row in rows])
+
+    return [obj.id for obj in objs]
+
+
+def write_chunk(model_cls: models.Model, db: str, rows: list[tuple[int, dict]]) -> tuple[list, list]:
+    # chunk failed by database error is split in halves until offending rows are found,
+    # so only they are reported and the rest is written
+    try:
+        with transaction.atomic(using=db):
+            return write_rows(model_cls, [data for _, data in rows]), []
+    except DatabaseError as exc:
+        if len(rows) == 1:
+            return [], [{'index': rows[0][0], 'errors': {'non_field_errors': [str(exc)]}}]
+
+    middle = len(rows) // 2
+    ids, errors = write_chunk(model_cls, db, rows[:middle])
+    more_ids, more_errors = write_chunk(model_cls, db, rows[middle:])
+
+    return ids + more_ids, errors + more_errors
+
+
+def insert_rows(model_cls: models.Model, serializer_cls, rows: list, atomic: bool = False) -> dict:
+    # invalid rows are reported and skipped, with atomic any error aborts whole batch
+    chunk_size = settings.DYNAMIC_MODELS['BULK_CHUNK_SIZE']
+    db = router.db_for_write(model_cls)
+    started = time.perf_counter()
+
+    valid, errors = validate_rows(serializer_cls, rows)
+    validated = time.perf_counter()
+
+    ids = []
+    if atomic and not errors:
+        try:
+            with transaction.atomic(using=db):
+                for pos in range(0, len(valid), chunk_size):
+                    ids.extend(write_rows(model_cls, [data for _, data in valid[pos:pos + chunk_size]]))
+        except DatabaseError as exc:
+            ids = []
+            errors = [{'index': None, 'errors': {'non_field_errors': [str(exc)]}}]
+    elif not atomic:
+        for pos in range(0, len(valid), chunk_size):
+            chunk_ids, chunk_errors = write_chunk(model_cls, db, valid[pos:pos + chunk_size])
+            ids.extend(chunk_ids)
+            errors.extend(chunk_errors)
+
+    finished = time.perf_counter()
+    errors.sort(key=lambda error: -1 if error['index'] is None else error['index'])
+
+    return {
+        'inserted': len(ids),
+        'ids': ids,
+        'errors': errors,
+        'stats': {
+            'rows': len(rows),
+            'chunk_size': chunk_size,
+            'validate_ms': round((validated - started) * 1000, 3),
+            'write_ms': round((finished - validated) * 1000, 3),
+            'rows_per_sec': round(len(ids) / (finished - started), 1) if ids else 0,
+        },
+    }
+
+
+def _copy_value(value) -> str:
+    # COPY text format
+    if value is None:
+        return '\\N'
+
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def _copy_rows(model_cls: models.Model, rows: list[dict]) -> list[int]:
+    # COPY doesn't return generated keys, so ids are taken from sequence upfront
+    connection = connections[router.db_for_write(model_cls)]
+    qn = connection.ops.quote_name
+    table = model_cls._meta.db_table
+    names = [f.name for f in model_cls._meta.concrete_fields if not f.primary_key]
+    columns = ', '.join(qn(model_cls._meta.get_field(name).column) for name in ['id'] + names)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+            [qn(table), len(rows)]
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+
+        buffer = io.StringIO()
+        for id, row in zip(ids, rows):
+            buffer.write('\t'.join([str(id)] + [_copy_value(row.get(name)) for name in names]))
+            buffer.write('\n')
+        buffer.seek(0)
+
+        # raw psycopg2 call, errors have to be converted to django ones explicitly
+        with connection.wrap_database_errors:
+            cursor.copy_expert(f'COPY {qn(table)} ({columns}) FROM STDIN', buffer)
+
+    return ids
@@ -0,0 +1,108 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .registry import model_registry
+
+
+class CacheEntry:
+    # everything built from one schema version of a table, dropped together on schema change
+    __slots__ = ('version', 'model_class', 'serializer_class', 'touched')
+
+    def __init__(self, version: int, model_class, touched: float = 0):
+        self.version = version
+        self.model_class = model_class
+        self.serializer_class = None
+        # monotonic time when table last use was stored
+        self.touched = touched
+
+
+class ModelCache:
+    # process wide LRU cache of built dynamic model classes keyed by table id and schema version
+    # only the newest schema version of every table is kept, older one is replaced on put
+    # classes leaving the cache are removed from model registry, so both stay bounded
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def max_size(self) -> int:
+        return settings.DYNAMIC_MODELS['MODEL_CACHE_SIZE']
+
+    def get(self, table_id: int, version: int) -> CacheEntry:
+        with self._lock:
+            entry = self._entries.get(table_id)
+            if entry is None or entry.version != version:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(table_id)
+            self.hits += 1
+
+            return entry
+
+    def put(self, table_id: int, version: int, model_class, touched: float = 0) -> CacheEntry:
+        entry = CacheEntry(version, model_class, touched)
+
+        with self._lock:
+            self._entries[table_id] = entry
+            self._entries.move_to_end(table_id)
+
+            while len(self._entries) > self.max_size:
+                _, evicted = self._entries.popitem(last=False)
+                self.evictions += 1
+                self._release(evicted)
+
+        return entry
+
+    def invalidate(self, table_id: int) -> None:
+        with self._lock:
+            entry = self._entries.pop(table_id, None)
+
+        if entry is not None:
+            self._release(entry)
+
+    def revalidate(self, versions: dict[int, int]) -> list[int]:
+        # drops entries which version differs from current one, returns ids of dropped entries
+        stale = []
+
+        with self._lock:
+            for table_id, version in versions.items():
+                entry = self._entries.get(table_id)
+                if entry is not None and entry.version != version:
+                    del self._entries[table_id]
+                    stale.append(table_id)
+                    self._release(entry)
+
+        return stale
+
+    def clear(self) -> None:
+        with self._lock:
+            for entry in self._entries.values():
+                self._release(entry)
+
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict[str, int]:
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'registry': model_registry.stats(),
+        }
+
+    def _release(self, entry: CacheEntry) -> None:
+        # class of dropped entry isn't needed anymore
+        # other request can have registered newer class of the table already, that one stays
+        model_registry.unregister(entry.model_class)
+
+
+model_cache = ModelCache()
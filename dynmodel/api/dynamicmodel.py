@@ -1,7 +1,27 @@
+import hashlib
+import itertools
+import logging
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from django.db import connection, models, transaction
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, models, transaction
+from django.db.models import F, Prefetch
+from django.utils import timezone
+
+from .cache import model_cache
+from .metrics import DDL_SECONDS, MODEL_BUILD_SECONDS, MODEL_LOOKUP_SECONDS, SERIALIZER_BUILD_SECONDS, timed
+from .models import DynamicColumnMigration, DynamicField, DynamicIndex, DynamicTable
+from .online import OnlineColumnMigration
+from .registry import model_registry
+from .replicas import read_alias
+from .search import create_search, drop_search
+from .serializers import generic_serializer
+from .sharding import place_tables, shards
 
-from .models import DynamicField, DynamicTable
+logger = logging.getLogger(__name__)
 
 
 class DynamicModel:
@@ -13,90 +33,691 @@ class DynamicModel:
         self.model_name = f'{self.tableprefix}{model_id}'
         self.model_id = model_id
         self.model_class = None
+        self.cache_entry = None
+        self.schema_version = None
+        self.data_version = None
+        self.shard = None
 
-    def create_model(self, fields: dict[str, str]) -> int:
-        new_table = DynamicTable.objects.create()
-        self.model_id = new_table.id
-        self.model_name = f'{self.tableprefix}{self.model_id}'
-
-        for name, fld_type in fields.items():
-            DynamicField.objects.create(name=name, fld_type=fld_type, table_def=new_table)
-
-        model_fields = self._convert_to_types(fields)
-        self._build_model_cls(model_fields)
-        self._create_table()
+    def create_model(self, fields: dict[str, str], indexes: list = None, search: list = None) -> int:
+        self._create_models([self], [(fields, indexes, search)])
 
         return self.model_id
 
-    @transaction.atomic
-    def update_model(self, new_fields: dict[str, str]) -> None:
+    @classmethod
+    def create_models(cls, definitions: list[tuple[dict[str, str], list, list]]) -> list[int]:
+        # many tables at once from (fields, indexes, search) tuples, all or none of them are created
+        mdls = [cls() for _ in definitions]
+        cls._create_models(mdls, definitions)
+
+        return [mdl.model_id for mdl in mdls]
+
+    @classmethod
+    def _create_models(cls, mdls: list['DynamicModel'], definitions: list[tuple[dict, list, list]]) -> None:
+        # definitions are written by one bulk insert per metadata model and tables are created
+        # in one schema editor session, so number of round trips doesn't grow with columns
+        for mdl, (fields, indexes, search) in zip(mdls, definitions):
+            mdl._validate_indexes(indexes or [], fields)
+            mdl._validate_search(search or [], fields)
+
+        for mdl, shard in zip(mdls, place_tables(len(mdls))):
+            mdl.shard = shard
+        shards = sorted({mdl.shard for mdl in mdls})
+
+        # metadata and tables of all shards are committed together, failure rolls back all of them
+        with ExitStack() as stack:
+            for shard in shards:
+                # SQLite schema editor needs foreign key checks off and they can't be switched in transaction
+                if connections[shard].disable_constraint_checking():
+                    stack.callback(connections[shard].enable_constraint_checking)
+
+            stack.enter_context(transaction.atomic())
+            for shard in shards:
+                stack.enter_context(transaction.atomic(using=shard))
+
+            now = timezone.now()
+            tables = DynamicTable.objects.bulk_create(
+                [DynamicTable(last_used=now, changed=now, shard=mdl.shard) for mdl in mdls]
+            )
+
+            new_fields = []
+            new_indexes = []
+            for mdl, table, (fields, indexes, search) in zip(mdls, tables, definitions):
+                mdl.model_id = table.id
+                mdl.model_name = f'{mdl.tableprefix}{mdl.model_id}'
+
+                new_fields.extend(
+                    DynamicField(name=name, fld_type=fld_type, table_def_id=table.id,
+                                 searchable=name in (search or ()))
+                    for name, fld_type in fields.items()
+                )
+
+                # tables are empty, so indexes are created together with them
+                model_indexes = mdl._normalize_indexes(indexes or [], fields)
+                new_indexes.extend(DynamicIndex(table_def_id=table.id, **index) for index in model_indexes)
+
+                mdl._build_model_cls(mdl._convert_to_types(fields), model_indexes, search or [])
+
+            DynamicField.objects.bulk_create(new_fields)
+            DynamicIndex.objects.bulk_create(new_indexes)
+
+            for shard in shards:
+                with connections[shard].schema_editor() as schema_editor:
+                    for mdl in mdls:
+                        if mdl.shard == shard:
+                            mdl._create_table(schema_editor)
+
+        for mdl, table in zip(mdls, tables):
+            mdl.cache_entry = model_cache.put(
+                mdl.model_id, table.schema_version, mdl.model_class, touched=time.monotonic()
+            )
+
+    def update_model(self, new_fields: dict[str, str], indexes: list = None, online: bool = False,
+                     search: list = None) -> list[dict]:
+        # indexes=None keeps existing indexes, except ones which columns are removed,
+        # search=None keeps searchable columns which stay character columns
+        # new indexes are built after schema change is committed, concurrently on PostgreSQL
+        # online=True changes column types through shadow columns without long table lock (PostgreSQL only)
+        # steps run after commit don't roll the schema change back, their errors are returned
+        online = online and self.db.vendor == 'postgresql'
+
+        # SQLite schema editor needs foreign key checks off and they can't be switched inside transaction
+        constraints_disabled = self.db.disable_constraint_checking()
+        try:
+            new_indexes, type_changes = self._update_schema(new_fields, indexes, online, search)
+        finally:
+            if constraints_disabled:
+                self.db.enable_constraint_checking()
+
+        errors = []
+        for column in type_changes:
+            online_change = OnlineColumnMigration.start(self, *column)
+            try:
+                online_change.run()
+            except DatabaseError as exc:
+                # failed migration is rolled back, interrupted one stays pending and can be resumed
+                migration = online_change.migration
+                errors.append({
+                    'column': migration.column, 'migration': migration.id, 'state': migration.state,
+                    'error': str(exc),
+                })
+
+        errors.extend(self._add_indexes(new_indexes))
+
+        return errors
+
+    def delete_model(self) -> None:
+        # drops table together with its definition
+        self.as_model()
+        self._delete_table()
+        DynamicTable.objects.filter(id=self.model_id).delete()
+        self._drop_model_cls()
+
+    def definition(self) -> dict:
+        # committed columns and indexes in the form of table definition
+        fields = DynamicField.objects.filter(table_def_id=self.model_id).order_by('id')
+        indexes = DynamicIndex.objects.filter(table_def_id=self.model_id).order_by('id')
+
+        return {
+            'columns': {field.name: field.get_fld_type_display() for field in fields},
+            'indexes': [{'fields': index.fields, 'unique': index.unique} for index in indexes],
+        }
+
+    @classmethod
+    def resume_column_migrations(cls) -> int:
+        # finishes online type changes interrupted by process exit
+        migrations = DynamicColumnMigration.objects.filter(state__in=('backfill', 'swap')).order_by('id')
+
+        for migration in migrations:
+            mdl = cls(migration.table_def_id)
+            OnlineColumnMigration(mdl, migration).run()
+
+        return len(migrations)
+
+    def _update_schema(self, new_fields: dict[str, str], indexes: list = None, online: bool = False,
+                       search: list = None) -> tuple[list[dict], list[tuple]]:
+        with transaction.atomic():
+            # row lock serializes concurrent schema changes and moves of the same table
+            table = DynamicTable.objects.select_for_update().only('shard').get(id=self.model_id)
+            self.shard = table.shard
+
+            # metadata on default database and DDL on table's shard are committed together,
+            # error on either of them rolls back both
+            with transaction.atomic(using=self.shard):
+                return self._change_schema(new_fields, indexes, online, search)
+
+    def _change_schema(self, new_fields: dict[str, str], indexes: list, online: bool,
+                       search: list) -> tuple[list[dict], list[tuple]]:
+        pending = DynamicColumnMigration.objects.filter(state__in=('backfill', 'swap'))
+        if pending.filter(table_def_id=self.model_id).exists():
+            raise ValueError('Column type change is in progress, schema can be changed after it is finished')
+
+        fields = list(DynamicField.objects.filter(table_def_id=self.model_id).order_by('id'))
+        model_def = self._convert_qs_types(fields)
+        old_indexes = self._convert_qs_indexes(DynamicIndex.objects.filter(table_def_id=self.model_id))
+
+        if indexes is None:
+            new_indexes = [index for index in old_indexes if set(index['fields']) <= new_fields.keys()]
+        else:
+            self._validate_indexes(indexes, new_fields)
+            new_indexes = self._normalize_indexes(indexes, new_fields)
+
+        new_names = {index['name'] for index in new_indexes}
+        old_names = {index['name'] for index in old_indexes}
+
+        self._build_model_cls(model_def, old_indexes)
+
+        plan = self._plan_update(fields, new_fields)
+        plan['remove_index'] = [index for index in old_indexes if index['name'] not in new_names]
+
+        # online type changes run after this transaction, each in its own steps
+        type_changes = []
+        if online:
+            type_changes, plan['change'] = plan['change'], []
+
+        # columns changed online keep their old type until the swap
+        current = dict(new_fields, **{name: old_type for name, old_type, _ in type_changes})
+        kept_indexes = [index for index in old_indexes if index['name'] in new_names]
+
+        old_search = [field.name for field in fields if field.searchable]
+        if search is None:
+            new_search = [name for name in old_search if new_fields.get(name) == 'c']
+        else:
+            self._validate_search(search, new_fields, current)
+            new_search = list(search)
+
+        # full text index depends on columns, it is rebuilt when they change, on SQLite also when
+        # schema editor remakes the table, which drops its triggers
+        remakes_table = self.db.vendor != 'postgresql' and any(plan.values())
+        rebuild_search = new_search != old_search or bool(old_search and remakes_table)
+        if rebuild_search:
+            with self.db.schema_editor() as schema_editor:
+                drop_search(schema_editor, self.model_class)
+
+        self._apply_plan(plan, fields, kept_indexes)
+
+        if rebuild_search:
+            table_fields = DynamicField.objects.filter(table_def_id=self.model_id)
+            table_fields.update(searchable=False)
+            table_fields.filter(name__in=new_search).update(searchable=True)
+
+            self._build_model_cls(self._convert_to_types(current), kept_indexes, new_search)
+            self._create_search()
+
+        # version is bumped in the same transaction as DDL, so other workers see both at once
+        DynamicTable.objects.filter(id=self.model_id).update(
+            schema_version=F('schema_version') + 1, data_version=F('data_version') + 1, changed=timezone.now()
+        )
+
+        # force model recreation, cached serializer goes away together with model class
+        self._drop_model_cls()
+
+        return [index for index in new_indexes if index['name'] not in old_names], type_changes
+
+    @timed(MODEL_LOOKUP_SECONDS)
+    def as_model(self) -> models.Model:
         if not self.model_class:
-            fields = DynamicField.objects.filter(table_def_id=self.model_id)
-            model_def = self._convert_qs_types(fields)
-            self._build_model_cls(model_def)            
+            # single pk lookup on primary, field list is loaded only when cached class is outdated
+            versions = DynamicTable.objects.values_list('schema_version', 'data_version', 'shard', 'changed')
+            version, self.data_version, self.shard, changed = versions.get(id=self.model_id)
+            self.schema_version = version
+            self.cache_entry = model_cache.get(self.model_id, version)
+            if self.cache_entry:
+                self.model_class = self.cache_entry.model_class
 
-        change_type = []
-        remove_column = []
+            if not self.model_class:
+                self._build_model_cls(*self._load_definition(version))
+                self.cache_entry = model_cache.put(self.model_id, version, self.model_class)
 
-        for field in fields:
-            if field.name not in new_fields.keys():
-                remove_column.append(field.name)
-            elif new_fields[field.name] == field.fld_type:
-                del new_fields[field.name]
-            elif new_fields[field.name] != field.fld_type:
-                change_type.append( (field.name, field.fld_type, new_fields[field.name],) )
-                del new_fields[field.name]
+            self._note_changed(changed)
 
-        # changing table definition is rare operation, so there is no need to make it batch operation
-        for column in change_type:
-            self._change_column_type(*column)
+        self._touch()
 
-        for name, fld_type in new_fields.items():
-            self._add_column(name, fld_type)
+        return self.model_class
 
-        for col in remove_column:
-            self._remove_column(col, model_def[col])
+    async def aas_model(self) -> models.Model:
+        # as_model for async views, the same queries through async ORM
+        with MODEL_LOOKUP_SECONDS.time():
+            if not self.model_class:
+                versions = DynamicTable.objects.values_list(
+                    'schema_version', 'data_version', 'shard', 'changed'
+                )
+                version, self.data_version, self.shard, changed = await versions.aget(id=self.model_id)
+                self.schema_version = version
+                self.cache_entry = model_cache.get(self.model_id, version)
+                if self.cache_entry:
+                    self.model_class = self.cache_entry.model_class
 
-        # force model recreation
-        self.model_class = None
+                if not self.model_class:
+                    self._build_model_cls(*await sync_to_async(self._load_definition)(version))
+                    self.cache_entry = model_cache.put(self.model_id, version, self.model_class)
 
-    def as_model(self) -> models.Model:
-        if not self.model_class:
-            model = DynamicTable.objects.get(id=self.model_id)
-            fields = DynamicField.objects.filter(table_def=model)
-            model_def = self._convert_qs_types(fields)
+                self._note_changed(changed)
 
-            self._build_model_cls(model_def)
+            if self._touch_due():
+                await DynamicTable.objects.filter(id=self.model_id).aupdate(last_used=timezone.now())
 
         return self.model_class
 
-    def _change_column_type(self, column_name: str, old_type: str, new_type: str) -> None:
+    def _load_definition(self, version: int) -> tuple[dict[str, models.Field], list[dict], list[str]]:
+        # definition comes from replica when it has the same schema version before and after reading it,
+        # so model class never mixes columns of two versions, otherwise from primary
+        replica = read_alias(DEFAULT_DB_ALIAS)
+        if replica != DEFAULT_DB_ALIAS and self._has_version(replica, version):
+            definition = self._read_definition(replica)
+            if self._has_version(replica, version):
+                return definition
+
+        return self._read_definition(DEFAULT_DB_ALIAS)
+
+    def _has_version(self, alias: str, version: int) -> bool:
+        return DynamicTable.objects.using(alias).filter(id=self.model_id, schema_version=version).exists()
+
+    def _read_definition(self, alias: str) -> tuple[dict[str, models.Field], list[dict], list[str]]:
+        fields = DynamicField.objects.using(alias).filter(table_def_id=self.model_id).order_by('id')
+        indexes = DynamicIndex.objects.using(alias).filter(table_def_id=self.model_id)
+        search = [field.name for field in fields if field.searchable]
+
+        return self._convert_qs_types(fields), self._convert_qs_indexes(indexes), search
+
+    def _note_changed(self, changed) -> None:
+        # router reads rows of recently changed table from primary, time only grows,
+        # so concurrent requests can't move it back
+        if changed and (self.model_class._changed is None or changed > self.model_class._changed):
+            self.model_class._changed = changed
+
+    @property
+    def db(self):
+        # connection of database holding the table, placement is read with schema version by as_model
+        if self.shard is None:
+            self.shard = DynamicTable.objects.values_list('shard', flat=True).get(id=self.model_id)
+
+        return connections[self.shard]
+
+    def bump_data_version(self) -> None:
+        # called after rows are written, so version read before data never labels newer data
+        DynamicTable.objects.filter(id=self.model_id).update(
+            data_version=F('data_version') + 1, changed=timezone.now()
+        )
+
+    async def abump_data_version(self) -> None:
+        await DynamicTable.objects.filter(id=self.model_id).aupdate(
+            data_version=F('data_version') + 1, changed=timezone.now()
+        )
+
+    def as_serializer(self):
+        self.as_model()
+
+        return self._cached_serializer()
+
+    async def aas_serializer(self):
+        await self.aas_model()
+
+        return self._cached_serializer()
+
+    def _cached_serializer(self):
+        if not self.cache_entry.serializer_class:
+            with SERIALIZER_BUILD_SECONDS.time():
+                self.cache_entry.serializer_class = generic_serializer(self.model_class)
+
+        return self.cache_entry.serializer_class
+
+    @timed(DDL_SECONDS, operation='move_table')
+    def move_to(self, shard: str) -> int:
+        # copies table to other database and switches its placement, returns number of copied rows
+        # reads are served from old database until the switch, writes are blocked by table lock
+        # on PostgreSQL, elsewhere they have to be stopped for the time of move
+        if shard not in shards():
+            raise ValueError(f'Unknown shard "{shard}"')
+
+        model_cls = self.as_model()
+        source = self.db
+        target = connections[shard]
+        if source.alias == target.alias:
+            raise ValueError(f'Table {self.model_name} is already on shard "{shard}"')
+
+        copied = 0
+        with ExitStack() as stack:
+            for db in (source, target):
+                # SQLite schema editor needs foreign key checks off and they can't be switched in transaction
+                if db.disable_constraint_checking():
+                    stack.callback(db.enable_constraint_checking)
+
+            # exits in reverse order: copy is committed first, placement next and old table is dropped last,
+            # so failed commit never leaves table without data
+            stack.enter_context(transaction.atomic(using=source.alias))
+            stack.enter_context(transaction.atomic())
+            stack.enter_context(transaction.atomic(using=target.alias))
+
+            # row lock serializes move with schema changes of the same table
+            DynamicTable.objects.select_for_update().get(id=self.model_id)
+
+            if source.vendor == 'postgresql':
+                with source.cursor() as cursor:
+                    cursor.execute(f'LOCK TABLE {source.ops.quote_name(self.model_name)} IN EXCLUSIVE MODE')
+
+            with target.schema_editor() as schema_editor:
+                self._create_table(schema_editor)
+
+            chunk_size = settings.DYNAMIC_MODELS['BULK_CHUNK_SIZE']
+            rows = model_cls.objects.using(source.alias).order_by('id').iterator(chunk_size=chunk_size)
+            while chunk := list(itertools.islice(rows, chunk_size)):
+                model_cls.objects.using(target.alias).bulk_create(chunk)
+                copied += len(chunk)
+
+            # rows are copied with their ids, which don't advance sequence
+            with target.cursor() as cursor:
+                for sql in target.ops.sequence_reset_sql(no_style(), [model_cls]):
+                    cursor.execute(sql)
+
+            DynamicTable.objects.filter(id=self.model_id).update(
+                shard=target.alias, schema_version=F('schema_version') + 1, changed=timezone.now()
+            )
+
+            with source.schema_editor() as schema_editor:
+                drop_search(schema_editor, model_cls)
+                schema_editor.delete_model(model_cls)
+
+        logger.info('Moved table %s with %d rows from %s to %s',
+                    self.model_name, copied, source.alias, target.alias)
+
+        self.shard = target.alias
+        self._drop_model_cls()
+
+        return copied
+
+    def register_admin(self) -> None:
+        model_registry.register_admin(self.as_model())
+
+    @classmethod
+    def warm_up(cls, limit: int = None, register_admin: bool = False) -> int:
+        # builds model classes and serializers of most recently used tables upfront,
+        # all definitions are loaded by three queries, no matter how many tables there are
+        limit = min(limit or settings.DYNAMIC_MODELS['WARM_UP_LIMIT'], model_cache.max_size)
+        tables = DynamicTable.objects.order_by(F('last_used').desc(nulls_last=True), '-id')[:limit]
+        tables = tables.prefetch_related(Prefetch('fields', DynamicField.objects.order_by('id')), 'indexes')
+
+        count = 0
+        for table in tables:
+            mdl = cls(table.id)
+            mdl.shard = table.shard
+            mdl._build_model_cls(mdl._convert_qs_types(table.fields.all()),
+                                 mdl._convert_qs_indexes(table.indexes.all()),
+                                 [field.name for field in table.fields.all() if field.searchable])
+            mdl.cache_entry = model_cache.put(table.id, table.schema_version, mdl.model_class,
+                                              touched=time.monotonic())
+            mdl._note_changed(table.changed)
+
+            # field map of serializer is built on first use, force it now
+            mdl.as_serializer()().fields
+
+            if register_admin:
+                mdl.register_admin()
+
+            count += 1
+
+        return count
+
+    @staticmethod
+    def current_versions(model_ids: list[int]) -> dict[int, int]:
+        versions = DynamicTable.objects.filter(id__in=model_ids).values_list('id', 'schema_version')
+        return dict(versions)
+
+    @classmethod
+    def revalidate(cls, model_ids: list[int]) -> list[int]:
+        # batched check of many cached classes with one query, returns ids of dropped stale classes
+        return model_cache.revalidate(cls.current_versions(model_ids))
+
+    def _touch(self) -> None:
+        if self._touch_due():
+            DynamicTable.objects.filter(id=self.model_id).update(last_used=timezone.now())
+
+    def _touch_due(self) -> bool:
+        # table last use time is stored at most once per resolution period by every worker
+        now = time.monotonic()
+
+        if now - self.cache_entry.touched >= settings.DYNAMIC_MODELS['LAST_USED_RESOLUTION']:
+            self.cache_entry.touched = now
+            return True
+
+        return False
+
+    def _plan_update(self, fields: list[DynamicField], new_fields: dict[str, str]) -> dict[str, list]:
+        current = {field.name: field.fld_type for field in fields}
+
+        return {
+            'remove': [name for name in current if name not in new_fields],
+            'change': [
+                (name, current[name], fld_type)
+                for name, fld_type in new_fields.items() if name in current and current[name] != fld_type
+            ],
+            'add': [(name, fld_type) for name, fld_type in new_fields.items() if name not in current],
+        }
+
+    @timed(DDL_SECONDS, operation='alter_table')
+    def _apply_plan(self, plan: dict[str, list], fields: list[DynamicField], indexes: list[dict]) -> None:
+        # whole diff goes in one schema editor session, on PostgreSQL as single ALTER TABLE statement,
+        # so table is locked and rewritten at most once
+        if not any(plan.values()):
+            return
+
+        started = time.perf_counter()
+
+        with self.db.schema_editor() as schema_editor:
+            # stale indexes are dropped before columns they depend on
+            if plan['remove_index']:
+                self._remove_indexes(schema_editor, plan['remove_index'])
+                self._build_model_cls(self._convert_qs_types(fields), indexes)
+
+            if self.db.vendor == 'postgresql':
+                if plan['remove'] or plan['change'] or plan['add']:
+                    sql = self._alter_table_sql(schema_editor, plan)
+                    logger.info('Altering table %s: %s', self.model_name, sql)
+                    schema_editor.execute(sql)
+            else:
+                logger.info('Altering table %s: %s', self.model_name, plan)
+                self._alter_table_fields(schema_editor, plan, fields, indexes)
+
+        logger.info('Table %s altered in %.1f ms', self.model_name, (time.perf_counter() - started) * 1000)
+
+        DynamicField.objects.filter(table_def_id=self.model_id, name__in=plan['remove']).delete()
+
+        changed = {name: new_type for name, _, new_type in plan['change']}
+        changed_fields = [field for field in fields if field.name in changed]
+        for field in changed_fields:
+            field.fld_type = changed[field.name]
+        DynamicField.objects.bulk_update(changed_fields, ['fld_type'])
+
+        DynamicField.objects.bulk_create(
+            DynamicField(name=name, fld_type=fld_type, table_def_id=self.model_id)
+            for name, fld_type in plan['add']
+        )
+
+    def _alter_table_sql(self, schema_editor, plan: dict[str, list]) -> str:
+        qn = schema_editor.quote_name
+        actions = []
+
+        for name in plan['remove']:
+            actions.append(f'DROP COLUMN {qn(name)} CASCADE')
+
+        for name, _, new_type in plan['change']:
+            db_type = self._convert_to_field(new_type, name).db_type(self.db)
+            actions.append(f'ALTER COLUMN {qn(name)} TYPE {db_type} USING {qn(name)}::{db_type}')
+
+        for name, fld_type in plan['add']:
+            column = self._convert_to_field(fld_type, name)
+            column.set_attributes_from_name(name)
+            definition, _ = schema_editor.column_sql(self.model_class, column, include_default=False)
+            actions.append(f'ADD COLUMN {qn(name)} {definition}')
+
+        return f'ALTER TABLE {qn(self.model_class._meta.db_table)} {", ".join(actions)}'
+
+    def _alter_table_fields(self, schema_editor, plan: dict[str, list], fields: list[DynamicField],
+                            indexes: list[dict]) -> None:
+        # some backends rebuild whole table from model class on alter, so class has to follow every change
+        current = {field.name: field.fld_type for field in fields}
+
+        for name, old_type, new_type in plan['change']:
+            self._change_column_type(schema_editor, name, old_type, new_type)
+            current[name] = new_type
+            self._build_model_cls(self._convert_to_types(current), indexes)
+
+        for name, fld_type in plan['add']:
+            self._add_column(schema_editor, name, fld_type)
+            current[name] = fld_type
+
+        if plan['add']:
+            self._build_model_cls(self._convert_to_types(current), indexes)
+
+        for name in plan['remove']:
+            self._remove_column(schema_editor, self.model_class._meta.get_field(name))
+
+    @timed(DDL_SECONDS, operation='change_column')
+    def _change_column_type(self, schema_editor, column_name: str, old_type: str, new_type: str) -> None:
         old_column = self._convert_to_field(old_type, column_name)
         old_column.set_attributes_from_name(column_name)
         new_column = self._convert_to_field(new_type, column_name)
         new_column.set_attributes_from_name(column_name)
 
-        with connection.schema_editor() as schema_editor:
-            schema_editor.alter_field(self.model_class, old_column, new_column)
-
-        o = DynamicField.objects.filter(table_def_id=self.model_id, name=column_name).get()
-        o.fld_type = new_type
-        o.save()
-
-    def _remove_column(self, column_name: str, column: models.Field) -> None:
-        with connection.schema_editor() as schema_editor:
-            schema_editor.remove_field(self.model_class, column)
+        schema_editor.alter_field(self.model_class, old_column, new_column)
 
-        DynamicField.objects.filter(table_def_id=self.model_id, name=column_name).delete()
+    @timed(DDL_SECONDS, operation='remove_column')
+    def _remove_column(self, schema_editor, column: models.Field) -> None:
+        schema_editor.remove_field(self.model_class, column)
 
-    def _add_column(self, column_name: str, column_type: str) -> None:
+    @timed(DDL_SECONDS, operation='add_column')
+    def _add_column(self, schema_editor, column_name: str, column_type: str) -> None:
         column = self._convert_to_field(column_type, column_name)
         column.set_attributes_from_name(column_name)
 
-        with connection.schema_editor() as schema_editor:
-            schema_editor.add_field(self.model_class, column)
+        schema_editor.add_field(self.model_class, column)
+
+    def _add_indexes(self, indexes: list[dict]) -> list[dict]:
+        # every index is built on its own, one which can't be built, like unique one on duplicate values,
+        # is returned with its error and doesn't stop the others
+        if not indexes:
+            return []
+
+        self.as_model()
+
+        # CREATE INDEX CONCURRENTLY doesn't block writes, but can't run inside transaction
+        concurrently = self.db.vendor == 'postgresql' and not self.db.in_atomic_block
+        errors = []
+
+        try:
+            for index in indexes:
+                try:
+                    with self.db.schema_editor(atomic=not concurrently) as schema_editor:
+                        self._add_index(schema_editor, index, concurrently)
+                except DatabaseError as exc:
+                    errors.append({'index': index['fields'], 'unique': index['unique'], 'error': str(exc)})
+                else:
+                    DynamicIndex.objects.create(table_def_id=self.model_id, **index)
+
+            # SQLite remakes table for unique constraint, which drops triggers of full text index
+            if self.db.vendor == 'sqlite' and any(index['unique'] for index in indexes):
+                with self.db.schema_editor() as schema_editor:
+                    drop_search(schema_editor, self.model_class)
+                    create_search(schema_editor, self.model_class, self.model_class._search)
+        finally:
+            DynamicTable.objects.filter(id=self.model_id).update(schema_version=F('schema_version') + 1)
+            self._drop_model_cls()
+
+        return errors
+
+    @timed(DDL_SECONDS, operation='add_index')
+    def _add_index(self, schema_editor, index: dict, concurrently: bool) -> None:
+        if not concurrently:
+            if index['unique']:
+                schema_editor.add_constraint(self.model_class, self._convert_to_index(index))
+            else:
+                schema_editor.add_index(self.model_class, self._convert_to_index(index))
+            return
+
+        qn = schema_editor.quote_name
+        table = qn(self.model_class._meta.db_table)
+        name = qn(index['name'])
+        columns = ', '.join(qn(self.model_class._meta.get_field(column).column) for column in index['fields'])
+        unique = 'UNIQUE ' if index['unique'] else ''
+
+        try:
+            schema_editor.execute(f'CREATE {unique}INDEX CONCURRENTLY {name} ON {table} ({columns})')
+        except DatabaseError:
+            # failed concurrent build leaves invalid index behind
+            schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+            raise
+
+        if index['unique']:
+            # constraint takes over already built index, so it only needs short lock
+            schema_editor.execute(f'ALTER TABLE {table} ADD CONSTRAINT {name} UNIQUE USING INDEX {name}')
+
+    @timed(DDL_SECONDS, operation='remove_indexes')
+    def _remove_indexes(self, schema_editor, indexes: list[dict]) -> None:
+        for index in indexes:
+            if index['unique']:
+                schema_editor.remove_constraint(self.model_class, self._convert_to_index(index))
+            else:
+                schema_editor.remove_index(self.model_class, self._convert_to_index(index))
+
+        names = [index['name'] for index in indexes]
+        DynamicIndex.objects.filter(table_def_id=self.model_id, name__in=names).delete()
+
+    def _validate_search(self, search: list, fields: dict[str, str], current: dict[str, str] = None) -> None:
+        # only character columns can be searchable, column changed online has to be character already
+        if not isinstance(search, list) or len(set(map(str, search))) != len(search):
+            raise ValueError('Searchable columns have to be a list of column names')
+
+        for name in search:
+            if name not in fields:
+                raise ValueError(f'Unknown searchable column "{name}"')
+
+            if fields[name] != 'c' or (current or fields)[name] != 'c':
+                raise ValueError(f'Searchable column "{name}" has to be character column')
+
+    def _validate_indexes(self, indexes: list, fields: dict[str, str]) -> None:
+        if not isinstance(indexes, list):
+            raise ValueError('Indexes have to be a list')
+
+        for index in indexes:
+            columns = self._index_columns(index)
+            if not columns or not isinstance(columns, list) or len(set(columns)) != len(columns):
+                raise ValueError(f'Invalid index definition "{index}"')
+
+            for name in columns:
+                if name not in fields:
+                    raise ValueError(f'Unknown index column "{name}"')
+
+    def _index_columns(self, index) -> list[str]:
+        # index can be given as column name, list of columns or {"fields": [...], "unique": true}
+        if isinstance(index, str):
+            return [index]
+
+        if isinstance(index, dict):
+            return index.get('fields')
+
+        return index
+
+    def _normalize_indexes(self, indexes: list, fields: dict[str, str]) -> list[dict]:
+        result = {}
+
+        for index in indexes:
+            columns = self._index_columns(index)
+            unique = isinstance(index, dict) and index.get('unique') is True
+
+            # name depends on definition only, so the same index is never rebuilt
+            digest = hashlib.md5(f'{unique}:{",".join(columns)}'.encode()).hexdigest()[:8]
+            name = f'{self.model_name}_{"ux" if unique else "ix"}_{digest}'
+            result[name] = {'name': name, 'fields': list(columns), 'unique': unique}
+
+        return list(result.values())
+
+    def _convert_qs_indexes(self, indexes: models.QuerySet) -> list[dict]:
+        return [{'name': index.name, 'fields': index.fields, 'unique': index.unique} for index in indexes]
+
+    def _convert_to_index(self, index: dict) -> models.Index:
+        if index['unique']:
+            return models.UniqueConstraint(fields=index['fields'], name=index['name'])
 
-        DynamicField.objects.create(name=column_name, fld_type=column_type, table_def_id=self.model_id)
+        return models.Index(fields=index['fields'], name=index['name'])
 
     def _convert_to_types(self, fields: dict[str, str]) -> dict[str, models.Field]:
         result = {}
@@ -127,21 +748,52 @@ class DynamicModel:
         
         raise ValueError(f'Unknown type "{in_type}"')
 
-    def _build_model_cls(self, fields_dict: dict[str, models.Field]) -> None:
+    @timed(MODEL_BUILD_SECONDS)
+    def _build_model_cls(self, fields_dict: dict[str, models.Field], indexes: list[dict] = (),
+                         search: list[str] = ()) -> None:
+        model_indexes = [self._convert_to_index(index) for index in indexes if not index['unique']]
+        model_constraints = [self._convert_to_index(index) for index in indexes if index['unique']]
+
         class Meta:
             app_label = 'api'
+            apps = model_registry.apps
             db_table = self.model_name
-
-        attrs = {'__module__': 'api.models', 'Meta': Meta}
+            indexes = model_indexes
+            constraints = model_constraints
+
+        # database of the table and time of its last change for router, searchable columns for search
+        attrs = {
+            '__module__': 'api.models', 'Meta': Meta, '_shard': self.db.alias, '_changed': None,
+            '_search': list(search),
+        }
         attrs.update(fields_dict)
 
+        model_registry.discard(self.model_name)
         self.model_class = type(self.model_name, (models.Model,), attrs)
+        model_registry.add(self.model_class)
+
+    def _drop_model_cls(self) -> None:
+        # class built during schema change is not cached, so it's unregistered here and not by cache
+        if self.model_class is not None:
+            model_registry.unregister(self.model_class)
+
+        self.model_class = None
+        self.cache_entry = None
+        model_cache.invalidate(self.model_id)
+
+    @timed(DDL_SECONDS, operation='create_table')
+    def _create_table(self, schema_editor):
+        schema_editor.create_model(self.model_class)
+        create_search(schema_editor, self.model_class, self.model_class._search)
 
-    def _create_table(self):
-        with connection.schema_editor() as schema_editor:
-            schema_editor.create_model(self.model_class)
+    @timed(DDL_SECONDS, operation='create_search')
+    def _create_search(self) -> None:
+        with self.db.schema_editor() as schema_editor:
+            create_search(schema_editor, self.model_class, self.model_class._search)
 
+    @timed(DDL_SECONDS, operation='delete_table')
     def _delete_table(self):
-        with connection.schema_editor() as schema_editor:
+        with self.db.schema_editor() as schema_editor:
+            drop_search(schema_editor, self.model_class)
             schema_editor.delete_model(self.model_class)
 
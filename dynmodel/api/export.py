@@ -0,0 +1,166 @@
+import csv
+import io
+import queue
+import threading
+import zlib
+
+from django.conf import settings
+from django.db import connections, models
+
+from .streaming import ndjson_rows
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# chunks of COPY output waiting for slow client, bounds memory of one export
+QUEUE_CHUNKS = 16
+
+_END = object()
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+def export_columns(model_cls: models.Model) -> list[str]:
+    # primary key and columns in order of table definition
+    return [field.name for field in model_cls._meta.concrete_fields]
+
+
+def export_rows(rows: models.QuerySet, columns: list[str], output: str, compress: bool = False):
+    if connections[rows.db].vendor == 'postgresql':
+        chunks = copy_chunks(rows.db, copy_sql(rows, columns, output))
+    elif output == 'csv':
+        chunks = csv_chunks(rows, columns)
+    else:
+        chunks = (chunk.encode() for chunk in ndjson_rows(rows.values(*columns)))
+
+    return gzip_chunks(chunks) if compress else chunks
+
+
+def gzip_chunks(chunks):
+    # gzip container compressed as data flow, nothing is kept but compressor state
+    compressor = zlib.compressobj(wbits=31)
+
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+
+    yield compressor.flush()
+
+
+def csv_chunks(rows: models.QuerySet, columns: list[str]):
+    # server side cursor on other backends, booleans written as 't'/'f' like COPY does
+    chunk_size = settings.DYNAMIC_MODELS['STREAM_CHUNK_SIZE']
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(columns)
+
+    for count, row in enumerate(rows.values_list(*columns).iterator(chunk_size=chunk_size), 1):
+        writer.writerow(['t' if value is True else 'f' if value is False else value for value in row])
+
+        if count % chunk_size == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue().encode()
+
+
+def copy_sql(rows: models.QuerySet, columns: list[str], output: str) -> str:
+    # filtered and ordered queryset compiled with its parameters inlined, COPY doesn't take parameters
+    sql, params = rows.values_list(*columns).query.sql_with_params()
+    with connections[rows.db].cursor() as cursor:
+        query = cursor.mogrify(sql, params).decode()
+
+    if output == 'csv':
+        return f'COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)'
+
+    # JSON escapes all control characters, so with these quote and delimiter csv format never quotes
+    # or escapes anything, unlike text format which doubles backslashes of JSON escapes
+    return (f'COPY (SELECT row_to_json(export) FROM ({query}) export) TO STDOUT '
+            f"WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')")
+
+
+class QueueWriter:
+    # file object for COPY output, passes it to response in buffers of EXPORT_BUFFER_SIZE bytes
+    # and blocks when client doesn't keep up
+    def __init__(self, chunks: queue.Queue, cancelled: threading.Event):
+        self.chunks = chunks
+        self.cancelled = cancelled
+        self.limit = settings.DYNAMIC_MODELS['EXPORT_BUFFER_SIZE']
+        self.buffer = []
+        self.size = 0
+
+    def write(self, data: bytes) -> None:
+        self.buffer.append(data)
+        self.size += len(data)
+
+        if self.size >= self.limit:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.buffer:
+            self.put(b''.join(self.buffer))
+            self.buffer = []
+            self.size = 0
+
+    def put(self, item) -> None:
+        while True:
+            if self.cancelled.is_set():
+                raise ExportCancelled()
+
+            try:
+                self.chunks.put(item, timeout=1)
+                return
+            except queue.Full:
+                pass
+
+
+def copy_to_queue(db, sql: str, writer: QueueWriter) -> None:
+    # psycopg2 COPY only writes to file object, so it runs in own thread
+    try:
+        with db.cursor() as cursor, db.wrap_database_errors:
+            cursor.copy_expert(sql, writer)
+        writer.flush()
+        writer.put(_END)
+    except ExportCancelled:
+        # connection is left in the middle of COPY, new one is opened on next use
+        db.close()
+    except Exception as exc:
+        try:
+            writer.put(exc)
+        except ExportCancelled:
+            pass
+
+
+def copy_chunks(alias: str, sql: str):
+    # COPY runs on connection of the request, shared with the thread for the time of export,
+    # so it sees the same data and no other connection is opened
+    db = connections[alias]
+    chunks = queue.Queue(maxsize=QUEUE_CHUNKS)
+    cancelled = threading.Event()
+    writer = QueueWriter(chunks, cancelled)
+    thread = threading.Thread(target=copy_to_queue, args=(db, sql, writer), daemon=True)
+
+    db.inc_thread_sharing()
+    thread.start()
+
+    try:
+        while True:
+            item = chunks.get()
+            if item is _END:
+                break
+
+            if isinstance(item, Exception):
+                raise item
+
+            yield item
+    finally:
+        # export is done or client went away, in that case COPY is aborted on its next write
+        cancelled.set()
+        thread.join()
+        db.dec_thread_sharing()
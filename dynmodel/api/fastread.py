@@ -0,0 +1,23 @@
+from django.db import models
+
+# django fields of dynamic column types ('c', 'i', 'b' and the primary key), database returns
+# their values already as python types serializer would output, so no mapping is needed
+PLAIN_FIELDS = (models.CharField, models.IntegerField, models.BooleanField)
+
+
+def plain_columns(model_cls: models.Model) -> list[str]:
+    # column names in the order serializer outputs them, None when some column needs serializer
+    fields = model_cls._meta.concrete_fields
+
+    if not all(isinstance(field, PLAIN_FIELDS) for field in fields):
+        return None
+
+    return [field.name for field in fields]
+
+
+def represent_rows(rows, serializer_cls) -> list:
+    # rows of values() queryset are in output form already
+    if serializer_cls is None:
+        return list(rows)
+
+    return serializer_cls(rows, many=True).data
@@ -0,0 +1,109 @@
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import models
+
+# query parameters which are not column filters
+RESERVED_PARAMS = {
+    'cursor', 'page_size', 'stream', 'ordering', 'format', 'atomic', 'agg', 'group_by', 'output', 'compress',
+    'all', 'batch_size',
+}
+
+# lookups allowed for dynamic column types, plain 'column=value' means exact match
+LOOKUPS = {
+    'c': {'exact', 'in', 'isnull', 'gt', 'gte', 'lt', 'lte', 'startswith'},
+    'i': {'exact', 'in', 'isnull', 'gt', 'gte', 'lt', 'lte'},
+    'b': {'exact', 'in', 'isnull'},
+}
+
+TRUE_VALUES = ('1', 'true', 'yes')
+FALSE_VALUES = ('0', 'false', 'no')
+
+
+def column_type(model_cls: models.Model, name: str) -> str:
+    try:
+        field = model_cls._meta.get_field(name)
+    except FieldDoesNotExist:
+        raise ValueError(f'Unknown column "{name}"')
+
+    if isinstance(field, models.BooleanField):
+        return 'b'
+
+    if isinstance(field, models.CharField):
+        return 'c'
+
+    # primary key is filtered as integer column
+    return 'i'
+
+
+def convert_bool(key: str, value: str) -> bool:
+    if value.lower() not in TRUE_VALUES + FALSE_VALUES:
+        raise ValueError(f'Invalid value "{value}" for "{key}", expected true or false')
+
+    return value.lower() in TRUE_VALUES
+
+
+def convert_value(model_cls: models.Model, name: str, value: str):
+    field = model_cls._meta.get_field(name)
+
+    if isinstance(field, models.BooleanField):
+        return convert_bool(name, value)
+
+    try:
+        return field.to_python(value)
+    except ValidationError:
+        raise ValueError(f'Invalid value "{value}" for column "{name}"')
+
+
+def parse_filters(model_cls: models.Model, params) -> models.Q:
+    condition = models.Q()
+
+    for key in params:
+        if key in RESERVED_PARAMS:
+            continue
+
+        name, _, lookup = key.partition('__')
+        lookup = lookup or 'exact'
+
+        if lookup not in LOOKUPS[column_type(model_cls, name)]:
+            raise ValueError(f'Lookup "{lookup}" is not allowed for column "{name}"')
+
+        for value in params.getlist(key):
+            if lookup == 'isnull':
+                value = convert_bool(key, value)
+            elif lookup == 'in':
+                value = [convert_value(model_cls, name, item) for item in value.split(',')]
+            else:
+                value = convert_value(model_cls, name, value)
+
+            condition &= models.Q(**{f'{name}__{lookup}': value})
+
+    return condition
+
+
+def has_filters(params) -> bool:
+    return any(key not in RESERVED_PARAMS for key in params)
+
+
+def parse_ordering(model_cls: models.Model, params) -> list[str]:
+    ordering = []
+
+    for item in params.get('ordering', '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+
+        # only one '-' marks descending order, rest has to be column name
+        column_type(model_cls, item[1:] if item.startswith('-') else item)
+        ordering.append(item)
+
+    return ordering
+
+
+def filter_rows(model_cls: models.Model, params) -> tuple[models.QuerySet, list[str]]:
+    # column filters and ordering from query string, validated against dynamic model fields
+    rows = model_cls.objects.filter(parse_filters(model_cls, params))
+    ordering = parse_ordering(model_cls, params)
+
+    if ordering:
+        rows = rows.order_by(*ordering)
+
+    return rows, ordering
@@ -0,0 +1,130 @@
+import logging
+import threading
+from concurrent.futures import Future, TimeoutError
+
+from django.conf import settings
+from django.db import DatabaseError, connections, models, router, transaction
+
+from .metrics import GROUP_COMMIT_ROWS
+
+logger = logging.getLogger(__name__)
+
+
+class Batch:
+    def __init__(self):
+        self.rows = []
+        self.futures = []
+        self.full = threading.Event()
+
+
+class GroupCommit:
+    # validated rows of concurrent single row inserts to the same table are written by one multi row INSERT
+    # and one commit, first request of batch waits up to GROUP_COMMIT_MAX_DELAY_MS for others
+    # and writes all of them, every request still gets its own id or error
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._batches = {}
+
+    def insert(self, mdl, data: dict) -> int:
+        # rows of one batch share model class, so schema version is part of the key
+        key = (mdl.model_id, mdl.schema_version)
+        future = Future()
+
+        with self._lock:
+            batch = self._batches.get(key)
+            leader = batch is None
+            if leader:
+                batch = self._batches[key] = Batch()
+
+            batch.rows.append(data)
+            batch.futures.append(future)
+
+            if len(batch.rows) >= settings.DYNAMIC_MODELS['GROUP_COMMIT_MAX_ROWS']:
+                # full batch is closed, next row starts new one
+                del self._batches[key]
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(settings.DYNAMIC_MODELS['GROUP_COMMIT_MAX_DELAY_MS'] / 1000)
+
+            with self._lock:
+                if self._batches.get(key) is batch:
+                    del self._batches[key]
+
+            self.flush(mdl, batch)
+
+        timeout = (settings.DYNAMIC_MODELS['GROUP_COMMIT_MAX_DELAY_MS']
+                   + settings.DYNAMIC_MODELS['GROUP_COMMIT_WRITE_TIMEOUT_MS']) / 1000
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            # row already taken by writing batch can't be inserted again, it waits for the batch
+            if not future.cancel():
+                return future.result()
+
+        # batch of stalled or dead leader skips cancelled row, so it is inserted alone
+        result = self.write(mdl.model_class, [data])[0]
+        if isinstance(result, Exception):
+            raise result
+        mdl.bump_data_version()
+        return result
+
+    def flush(self, mdl, batch: Batch) -> None:
+        # rows whose requests gave up waiting are cancelled and not written
+        rows, futures = [], []
+        for row, future in zip(batch.rows, batch.futures):
+            if future.set_running_or_notify_cancel():
+                rows.append(row)
+                futures.append(future)
+
+        try:
+            results = self.write(mdl.model_class, rows)
+        except Exception as exc:
+            results = [exc] * len(rows)
+
+        # rows are acknowledged right after commit, so no request waits forever even when write fails
+        for future, result in zip(futures, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+        # committed rows stay acknowledged when bookkeeping fails
+        try:
+            if any(not isinstance(result, Exception) for result in results):
+                mdl.bump_data_version()
+            GROUP_COMMIT_ROWS.observe(len(rows))
+        except Exception:
+            logger.exception('Group commit of table %d wrote %d rows, but failed after commit',
+                             mdl.model_id, len(rows))
+
+    def write(self, model_cls: models.Model, rows: list[dict]) -> list:
+        # ids of rows or errors, one bad row fails whole statement, so rows are retried one by one to find it
+        try:
+            return self.commit(model_cls, rows)
+        except DatabaseError as exc:
+            if len(rows) == 1:
+                return [exc]
+
+        results = []
+        for row in rows:
+            results.extend(self.write(model_cls, [row]))
+
+        return results
+
+    def commit(self, model_cls: models.Model, rows: list[dict]) -> list[int]:
+        db = connections[router.db_for_write(model_cls)]
+
+        with transaction.atomic(using=db.alias):
+            if db.vendor == 'postgresql' and not settings.DYNAMIC_MODELS['GROUP_COMMIT_SYNCHRONOUS']:
+                # commit doesn't wait for WAL flush, crash can lose last acknowledged rows
+                with db.cursor() as cursor:
+                    cursor.execute('SET LOCAL synchronous_commit = off')
+
+            # small batches, multi row INSERT returns ids in one statement, unlike COPY
+            objs = model_cls.objects.bulk_create([model_cls(**row) for row in rows])
+
+        return [obj.id for obj in objs]
+
+
+group_commit = GroupCommit()
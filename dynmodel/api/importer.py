@@ -0,0 +1,183 @@
+import csv
+import io
+import itertools
+import logging
+import re
+import time
+
+from django.conf import settings
+
+from .bulk import insert_rows
+from .dynamicmodel import DynamicModel
+
+logger = logging.getLogger(__name__)
+
+# boolean values recognized by inference, '0' and '1' alone make integer column
+BOOL_VALUES = {'true', 'false', 't', 'f', 'yes', 'no'}
+
+# range of integer column
+INT_MIN = -2 ** 31
+INT_MAX = 2 ** 31 - 1
+
+
+def column_name(header: str) -> str:
+    # CSV header made usable as column name, '__' is reserved for lookups
+    name = re.sub(r'\W+', '_', header.strip().lower())
+    name = re.sub(r'_{2,}', '_', name).strip('_')
+
+    if not name or name[0].isdigit():
+        name = f'col_{name}'
+
+    return name[:63]
+
+
+def is_int(value: str) -> bool:
+    try:
+        return INT_MIN <= int(value) <= INT_MAX
+    except ValueError:
+        return False
+
+
+def infer_type(values) -> str:
+    # type of column from sample values, empty values are nulls and don't count
+    values = [value.strip() for value in values if value.strip()]
+
+    if values and all(is_int(value) for value in values):
+        return 'i'
+
+    if values and all(value.lower() in BOOL_VALUES for value in values):
+        return 'b'
+
+    return 'c'
+
+
+def infer_schema(columns: list[str], sample: list[list[str]]) -> dict[str, str]:
+    return {
+        name: infer_type(row[pos] for row in sample if len(row) == len(columns))
+        for pos, name in enumerate(columns)
+    }
+
+
+class CsvImport:
+    # reads CSV from binary file object row by row, only one chunk of rows is held in memory
+    # and every chunk is inserted in its own transactions, rows which can't be inserted are reported
+    def __init__(self, file, delimiter: str = ',', progress=None):
+        self.file = file
+        # lines are split by CSV reader only, unicode line separators are ordinary characters
+        text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+        self.reader = csv.reader(text, delimiter=delimiter)
+        self.progress = progress
+
+        self.rows = 0
+        self.inserted = 0
+        self.rejected = 0
+        self.errors = []
+
+        try:
+            self.header = next(self.reader)
+        except StopIteration:
+            raise ValueError('CSV file is empty')
+        except (csv.Error, UnicodeDecodeError) as exc:
+            raise ValueError(f'Invalid CSV file - {exc}')
+
+        self.columns = [column_name(header) for header in self.header]
+        if len(set(self.columns)) != len(self.columns):
+            raise ValueError(f'Duplicate columns in CSV header: {", ".join(self.header)}')
+
+    def into_new_table(self) -> dict:
+        sample = list(itertools.islice(self.lines(), settings.DYNAMIC_MODELS['IMPORT_SAMPLE_ROWS']))
+
+        # ids are generated, 'id' column of file is skipped
+        schema = infer_schema(self.columns, [row for _, row in sample])
+        schema.pop('id', None)
+
+        mdl = DynamicModel()
+        id = mdl.create_model(schema)
+
+        try:
+            result = self.insert(mdl, itertools.chain(sample, self.lines()))
+        except ValueError:
+            # file broken after the sample leaves no table with part of its rows behind
+            mdl.delete_model()
+            raise
+
+        return result | {'id': id, 'schema': schema}
+
+    def into_table(self, mdl: DynamicModel) -> dict:
+        model_cls = mdl.as_model()
+        known = {field.name for field in model_cls._meta.concrete_fields}
+        unknown = [name for name in self.columns if name not in known]
+
+        if unknown:
+            raise ValueError(f'Unknown columns: {", ".join(unknown)}')
+
+        return self.insert(mdl, self.lines())
+
+    def lines(self):
+        # (line number, values), lines are counted from 1 with header, without multiline values
+        try:
+            for row in self.reader:
+                if row:
+                    yield self.reader.line_num, row
+        except (csv.Error, UnicodeDecodeError) as exc:
+            raise ValueError(f'Invalid CSV in line {self.reader.line_num + 1} - {exc}')
+
+    def insert(self, mdl: DynamicModel, lines) -> dict:
+        model_cls = mdl.as_model()
+        serializer_cls = mdl.as_serializer()
+        columns = [(pos, name) for pos, name in enumerate(self.columns) if name != 'id']
+        chunk_size = settings.DYNAMIC_MODELS['BULK_CHUNK_SIZE']
+        started = time.perf_counter()
+
+        while True:
+            chunk = list(itertools.islice(lines, chunk_size))
+            if not chunk:
+                break
+
+            rows = []
+            line_numbers = []
+            for line_no, values in chunk:
+                if len(values) != len(self.columns):
+                    self.reject(line_no, {'non_field_errors': [f'Expected {len(self.columns)} values']})
+                    continue
+
+                # CSV can't tell empty string from missing value, both are null
+                rows.append({name: values[pos] if values[pos] != '' else None for pos, name in columns})
+                line_numbers.append(line_no)
+
+            if rows:
+                result = insert_rows(model_cls, serializer_cls, rows)
+                self.inserted += result['inserted']
+                if result['inserted']:
+                    mdl.bump_data_version()
+                for error in result['errors']:
+                    self.reject(line_numbers[error['index']], error['errors'])
+
+            self.rows += len(chunk)
+            self.report(started)
+
+        return self.result(started)
+
+    def reject(self, line_no: int, errors: dict) -> None:
+        # only first errors are kept, so report of huge file stays small
+        self.rejected += 1
+
+        if len(self.errors) < settings.DYNAMIC_MODELS['IMPORT_MAX_ERRORS']:
+            self.errors.append({'line': line_no, 'errors': errors})
+
+    def result(self, started: float) -> dict:
+        elapsed = time.perf_counter() - started
+
+        return {
+            'rows': self.rows,
+            'inserted': self.inserted,
+            'rejected': self.rejected,
+            'errors': self.errors,
+            'rows_per_sec': round(self.rows / elapsed, 1) if elapsed else 0,
+        }
+
+    def report(self, started: float) -> None:
+        logger.info('Imported %d rows, %d rejected', self.rows, self.rejected)
+
+        if self.progress:
+            self.progress(self.result(started) | {'bytes': self.file.tell()})
@@ -0,0 +1,82 @@
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+from .benchmark import percentile
+
+
+async def http_request(reader, writer, host: str, method: str, path: str, body: bytes = b'') -> int:
+    # minimal HTTP/1.1 client on keep-alive connection, returns status and drops response body
+    writer.write(
+        f'{method} {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n'
+        f'Content-Length: {len(body)}\r\n\r\n'.encode() + body
+    )
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    chunked = False
+
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+
+        name, _, value = line.decode('latin-1').partition(':')
+        name = name.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'transfer-encoding' and 'chunked' in value.lower():
+            chunked = True
+
+    if chunked:
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if not size:
+                break
+    elif length:
+        await reader.readexactly(length)
+
+    return status
+
+
+async def load(url: str, method: str, path: str, body=None, concurrency: int = 32,
+               duration: float = 10) -> dict:
+    # every client keeps one connection and sends next request right after previous response
+    parts = urlsplit(url)
+    host = parts.hostname
+    port = parts.port or 80
+    data = json.dumps(body).encode() if body is not None else b''
+    latencies = []
+    errors = 0
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + duration
+
+    async def client():
+        nonlocal errors
+        reader, writer = await asyncio.open_connection(host, port)
+
+        try:
+            while loop.time() < deadline:
+                started = time.perf_counter()
+                status = await http_request(reader, writer, parts.netloc, method, path, data)
+                latencies.append((time.perf_counter() - started) * 1000)
+
+                if status >= 400:
+                    errors += 1
+        finally:
+            writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'requests_per_sec': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+    }
@@ -0,0 +1,65 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from api.benchmark import Benchmark, compare
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks table and row API on scratch test database, optionally against stored baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tables', type=int, default=10, help='tables to create')
+        parser.add_argument('--columns', type=int, default=5, help='columns per table')
+        parser.add_argument('--rows', type=int, default=1000, help='rows inserted in bulk per table')
+        parser.add_argument('--single-rows', type=int, default=100, help='rows created one by one')
+        parser.add_argument('--concurrency', type=int, default=1, help='threads running the calls')
+        parser.add_argument('--output', default='benchmark-results.json', help='JSON results file')
+        parser.add_argument('--baseline', help='JSON results of earlier run to compare with')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='allowed relative change of latency, throughput and query count')
+
+    def handle(self, *args, **options):
+        if options['tables'] < 1:
+            raise CommandError('At least one table is needed')
+
+        concurrency = options['concurrency']
+        if connection.vendor == 'sqlite' and concurrency > 1:
+            # in memory test database of SQLite fails concurrent writes instead of waiting for lock
+            self.stderr.write('SQLite test database does not support concurrent writes, using concurrency 1')
+            concurrency = 1
+
+        benchmark = Benchmark(options['tables'], options['columns'], options['rows'],
+                              concurrency, options['single_rows'])
+
+        # same isolated database and request setup as test runner, real data are never touched
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            results = benchmark.run()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        with open(options['output'], 'w') as output:
+            json.dump(results, output, indent=2)
+
+        for name, summary in results['results'].items():
+            rows = f", {summary['rows_per_sec']} rows/s" if 'rows_per_sec' in summary else ''
+            self.stdout.write(f"{name:<18} p50 {summary['p50_ms']} ms, p90 {summary['p90_ms']} ms, "
+                              f"p99 {summary['p99_ms']} ms, {summary['ops_per_sec']} ops/s{rows}, "
+                              f"{summary['queries_per_op']} queries/op, {summary['errors']} errors")
+
+        if not options['baseline']:
+            return
+
+        with open(options['baseline']) as baseline:
+            regressions = compare(results, json.load(baseline), options['threshold'])
+
+        if regressions:
+            raise CommandError('Regressions against baseline:\n' + '\n'.join(regressions))
+
+        self.stdout.write(self.style.SUCCESS('No regressions against baseline'))
@@ -0,0 +1,69 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory
+
+from api import views
+from api.bulk import write_rows
+from api.dynamicmodel import DynamicModel
+from api.models import DynamicTable
+
+
+class Command(BaseCommand):
+    help = 'Compares rows/sec of list rows with serializer and with fast read path on a scratch table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='rows in scratch table')
+        parser.add_argument('--repeat', type=int, default=3, help='runs of every variant, best one counts')
+
+    def handle(self, *args, **options):
+        mdl = DynamicModel()
+        id = mdl.create_model({'make': 'c', 'model': 'c', 'year': 'i', 'valid': 'b'})
+
+        try:
+            rows = [
+                {'make': f'make{i}', 'model': f'model{i}' if i % 5 else None, 'year': 1990 + i % 30,
+                 'valid': i % 3 == 0}
+                for i in range(options['rows'])
+            ]
+            write_rows(mdl.as_model(), rows)
+
+            for stream in (False, True):
+                results = {}
+                for fast_read in (False, True):
+                    results[fast_read] = self.measure(id, stream, fast_read, options['repeat'])
+
+                if results[False][1] != results[True][1]:
+                    raise CommandError('Fast read path output differs from serializer output')
+
+                variant = 'stream' if stream else 'list'
+                before, after = len(rows) / results[False][0], len(rows) / results[True][0]
+                self.stdout.write(f'{variant}: serializer {before:.0f} rows/sec, '
+                                  f'fast read {after:.0f} rows/sec ({after / before:.1f}x)')
+        finally:
+            mdl._delete_table()
+            DynamicTable.objects.filter(id=id).delete()
+
+    def measure(self, id: int, stream: bool, fast_read: bool, repeat: int) -> tuple[float, bytes]:
+        # cached response would be measured instead of reading rows after first run
+        dm = dict(settings.DYNAMIC_MODELS, FAST_READ=fast_read, RESPONSE_CACHE=None)
+        request = APIRequestFactory().get(f'/api/table/{id}/rows/', {'stream': 'true'} if stream else {})
+        best = None
+
+        # host of request factory, like test runner allows it
+        with override_settings(DYNAMIC_MODELS=dm, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for _ in range(repeat):
+                started = time.perf_counter()
+
+                response = views.table_rows(request, id=id)
+                if stream:
+                    content = b''.join(response.streaming_content)
+                else:
+                    content = response.render().content
+
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+
+        return best, content
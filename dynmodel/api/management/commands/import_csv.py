@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.dynamicmodel import DynamicModel
+from api.importer import CsvImport
+
+
+class Command(BaseCommand):
+    help = 'Imports CSV file into new table with inferred column types or into existing table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file with header')
+        parser.add_argument('--table', type=int, help='existing table, new one is created when not given')
+        parser.add_argument('--delimiter', default=',', help='field delimiter')
+
+    def progress(self, result: dict) -> None:
+        self.stdout.write(f"{result['bytes'] / 2 ** 20:.1f} MB, {result['rows']} rows, "
+                          f"{result['rejected']} rejected, {result['rows_per_sec']} rows/s")
+
+    def handle(self, *args, **options):
+        with open(options['path'], 'rb') as file:
+            try:
+                csv_import = CsvImport(file, options['delimiter'], self.progress)
+
+                if options['table'] is None:
+                    result = csv_import.into_new_table()
+                    self.stdout.write(f"Created table {result['id']} with columns {result['schema']}")
+                else:
+                    result = csv_import.into_table(DynamicModel(options['table']))
+            except ValueError as exc:
+                raise CommandError(str(exc))
+
+        for error in result['errors']:
+            self.stdout.write(f"line {error['line']}: {error['errors']}")
+
+        self.stdout.write(f"Inserted {result['inserted']} of {result['rows']} rows, "
+                          f"{result['rejected']} rejected")
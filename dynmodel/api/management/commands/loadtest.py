@@ -0,0 +1,56 @@
+import asyncio
+import json
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand
+
+from api.loadtest import load
+
+
+class Command(BaseCommand):
+    help = ('Compares throughput of sync and async row views on running server, '
+            'e.g. uvicorn dynmodel.asgi:application')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='server address')
+        parser.add_argument('--table', type=int, help='existing table, new one is created when not given')
+        parser.add_argument('--rows', type=int, default=100, help='rows of created table')
+        parser.add_argument('--concurrency', type=int, default=32, help='concurrent connections')
+        parser.add_argument('--duration', type=float, default=10, help='seconds of every run')
+
+    def post(self, url: str, data) -> dict:
+        request = Request(url, json.dumps(data).encode(), {'Content-Type': 'application/json'})
+        with urlopen(request) as response:
+            return json.load(response)
+
+    def handle(self, *args, **options):
+        url = options['url'].rstrip('/')
+        id = options['table']
+
+        if id is None:
+            datamodel = {'make': 'character', 'year': 'integer', 'valid': 'boolean'}
+            id = self.post(f'{url}/api/table/', datamodel)['id']
+            rows = [{'make': f'make{i}', 'year': 2000 + i % 20, 'valid': i % 2 == 0}
+                    for i in range(options['rows'])]
+            self.post(f'{url}/api/table/{id}/rows/', rows)
+            self.stdout.write(f'Created table {id} with {len(rows)} rows')
+
+        row = {'make': 'toyota', 'year': 2012, 'valid': True}
+        scenarios = [
+            ('list rows', 'GET', 'rows/', None),
+            ('create row', 'POST', 'row/', row),
+        ]
+
+        for name, method, path, body in scenarios:
+            results = {}
+            for variant, prefix in (('sync', '/api'), ('async', '/api/async')):
+                results[variant] = asyncio.run(load(url, method, f'{prefix}/table/{id}/{path}', body,
+                                                    options['concurrency'], options['duration']))
+                result = results[variant]
+                self.stdout.write(f"{name:<10} {variant:<5} {result['requests_per_sec']} req/s, "
+                                  f"p50 {result['p50_ms']} ms, p99 {result['p99_ms']} ms, "
+                                  f"{result['errors']} errors of {result['requests']}")
+
+            if results['sync']['requests_per_sec']:
+                ratio = results['async']['requests_per_sec'] / results['sync']['requests_per_sec']
+                self.stdout.write(f'{name:<10} async/sync throughput {ratio:.2f}x')
@@ -0,0 +1,27 @@
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from api.dynamicmodel import DynamicModel
+from api.models import DynamicTable
+
+
+class Command(BaseCommand):
+    help = 'Moves dynamic table with its rows to other shard database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('table', type=int, help='table id')
+        parser.add_argument('shard', help='database alias from SHARDS')
+
+    def handle(self, *args, **options):
+        try:
+            rows = DynamicModel(options['table']).move_to(options['shard'])
+        except ObjectDoesNotExist:
+            raise CommandError(f"Table {options['table']} does not exist")
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(f"Moved table {options['table']} with {rows} rows to {options['shard']}")
+
+        for row in DynamicTable.objects.values('shard').annotate(tables=Count('id')).order_by('shard'):
+            self.stdout.write(f"{row['shard']}: {row['tables']} tables")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.dynamicmodel import DynamicModel
+
+
+class Command(BaseCommand):
+    help = 'Finishes online column type changes interrupted by process exit'
+
+    def handle(self, *args, **options):
+        count = DynamicModel.resume_column_migrations()
+        self.stdout.write(f'Resumed {count} column migration(s)')
@@ -0,0 +1,274 @@
+import asyncio
+import bisect
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from functools import wraps
+
+from asgiref.sync import markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+from .cache import model_cache
+from .registry import model_registry
+
+# upper bounds of histogram buckets, cached model lookup takes microseconds, DDL seconds
+SECONDS_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100, 250, 1000)
+
+
+def enabled() -> bool:
+    return settings.DYNAMIC_MODELS['METRICS']
+
+
+def format_labels(labels: tuple) -> str:
+    if not labels:
+        return ''
+
+    values = ','.join(f'{name}="{value}"' for name, value in labels)
+    return f'{{{values}}}'
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        if not enabled():
+            return
+
+        key = tuple(sorted(labels.items()))
+
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+
+        for labels, value in items:
+            yield '', labels, value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, buckets: tuple = SECONDS_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        # labels -> [per bucket counts, sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        if not enabled():
+            return
+
+        key = tuple(sorted(labels.items()))
+        pos = bisect.bisect_left(self.buckets, value)
+
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = [[0] * len(self.buckets), 0, 0]
+
+            if pos < len(self.buckets):
+                data[0][pos] += 1
+            data[1] += value
+            data[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        if not enabled():
+            yield
+            return
+
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(labels, list(data[0]), data[1], data[2]) for labels, data in self._values.items()]
+
+        for labels, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield '_bucket', labels + (('le', bound),), cumulative
+
+            yield '_bucket', labels + (('le', '+Inf'),), count
+            yield '_sum', labels, total
+            yield '_count', labels, count
+
+
+class CallbackMetric:
+    # value read at scrape time from state kept elsewhere, e.g. model cache counters
+    def __init__(self, name: str, help: str, kind: str, collect):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.collect = collect
+
+    def samples(self):
+        yield '', (), self.collect()
+
+
+class MetricsRegistry:
+    # metrics of one worker process in Prometheus text format, every worker is scraped separately
+    def __init__(self):
+        self._metrics = []
+
+    def add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self.add(Counter(name, help))
+
+    def histogram(self, name: str, help: str, buckets: tuple = SECONDS_BUCKETS) -> Histogram:
+        return self.add(Histogram(name, help, buckets))
+
+    def callback(self, name: str, help: str, kind: str, collect) -> CallbackMetric:
+        return self.add(CallbackMetric(name, help, kind, collect))
+
+    def render(self) -> str:
+        lines = []
+
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+
+            for suffix, labels, value in metric.samples():
+                lines.append(f'{metric.name}{suffix}{format_labels(labels)} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+metrics_registry = MetricsRegistry()
+
+MODEL_LOOKUP_SECONDS = metrics_registry.histogram(
+    'dynmodel_model_lookup_seconds', 'Time to resolve model class of table, cached or built')
+MODEL_BUILD_SECONDS = metrics_registry.histogram(
+    'dynmodel_model_build_seconds', 'Time to build model class from table definition')
+SERIALIZER_BUILD_SECONDS = metrics_registry.histogram(
+    'dynmodel_serializer_build_seconds', 'Time to create serializer class of model')
+DDL_SECONDS = metrics_registry.histogram(
+    'dynmodel_ddl_seconds', 'Duration of schema changes by operation')
+ROWS_SERIALIZE_SECONDS = metrics_registry.histogram(
+    'dynmodel_rows_serialize_seconds', 'Time to turn listed rows into output data')
+RENDER_SECONDS = metrics_registry.histogram(
+    'dynmodel_render_seconds', 'Time to encode response data as JSON')
+ROWS_SERVED = metrics_registry.counter(
+    'dynmodel_rows_served_total', 'Rows returned by rows listing')
+ROWS_INSERTED = metrics_registry.counter(
+    'dynmodel_rows_inserted_total', 'Rows inserted')
+ROWS_UPDATED = metrics_registry.counter(
+    'dynmodel_rows_updated_total', 'Rows changed by update by filter')
+ROWS_DELETED = metrics_registry.counter(
+    'dynmodel_rows_deleted_total', 'Rows removed by delete by filter')
+GROUP_COMMIT_ROWS = metrics_registry.histogram(
+    'dynmodel_group_commit_rows', 'Rows of single row inserts written by one group commit', COUNT_BUCKETS)
+RESPONSE_CACHE_REQUESTS = metrics_registry.counter(
+    'dynmodel_response_cache_requests_total', 'Cacheable responses by result, hit or miss')
+REQUEST_SECONDS = metrics_registry.histogram(
+    'dynmodel_request_seconds', 'Request duration by view')
+REQUEST_SQL_SECONDS = metrics_registry.histogram(
+    'dynmodel_request_sql_seconds', 'Time spent in database queries per request by view')
+REQUEST_QUERIES = metrics_registry.histogram(
+    'dynmodel_request_queries', 'Database queries per request by view', COUNT_BUCKETS)
+
+for key, kind in (('hits', 'counter'), ('misses', 'counter'), ('evictions', 'counter'), ('size', 'gauge')):
+    suffix = '_total' if kind == 'counter' else ''
+    metrics_registry.callback(f'dynmodel_model_cache_{key}{suffix}', f'Model cache {key}', kind,
+                              lambda key=key: model_cache.stats()[key])
+
+metrics_registry.callback('dynmodel_registered_models', 'Dynamic model classes in model registry', 'gauge',
+                          lambda: model_registry.stats()['models'])
+metrics_registry.callback('dynmodel_registered_models_bytes', 'Approximate size of registered model classes',
+                          'gauge', lambda: model_registry.stats()['approx_bytes'])
+
+
+def timed(histogram: Histogram, **labels):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with histogram.time(**labels):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class MetricsMiddleware:
+    # duration, query count and query time of every request, queries are counted by execute wrapper,
+    # so DEBUG query log is not needed; queries of streamed content run after response is returned
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+
+        # async views under ASGI are not pushed through thread pool because of this middleware
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        if not enabled():
+            return self.get_response(request)
+
+        queries = [0, 0.0]
+
+        def count_query(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                queries[0] += 1
+                queries[1] += time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            # rows of routed tables are read and written on shard and replica databases
+            wrapped = []
+            for alias in settings.DATABASES:
+                if not any(connections[alias] is db for db in wrapped):
+                    wrapped.append(connections[alias])
+                    stack.enter_context(connections[alias].execute_wrapper(count_query))
+
+            response = self.get_response(request)
+
+        view = self.view_name(request)
+        REQUEST_SECONDS.observe(time.perf_counter() - started, view=view)
+        REQUEST_QUERIES.observe(queries[0], view=view)
+        REQUEST_SQL_SECONDS.observe(queries[1], view=view)
+
+        return response
+
+    async def __acall__(self, request):
+        # async ORM runs queries in worker thread with its own connection, only duration is measured
+        if not enabled():
+            return await self.get_response(request)
+
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        REQUEST_SECONDS.observe(time.perf_counter() - started, view=self.view_name(request))
+
+        return response
+
+    def view_name(self, request) -> str:
+        return request.resolver_match.url_name if request.resolver_match else 'unknown'
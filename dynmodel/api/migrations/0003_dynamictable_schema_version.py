@@ -0,0 +1,18 @@
+# Generated by Django 4.1.7 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_rename_model_schema_dynamicfield_table_def_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dynamictable',
+            name='schema_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.1.7 on 2026-10-18 13:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_dynamictable_schema_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DynamicIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=63)),
+                ('fields', models.JSONField()),
+                ('unique', models.BooleanField(default=False)),
+                ('table_def', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='indexes', to='api.dynamictable')),
+            ],
+            options={
+                'unique_together': {('name', 'table_def')},
+            },
+        ),
+    ]
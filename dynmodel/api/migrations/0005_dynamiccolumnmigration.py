@@ -0,0 +1,29 @@
+# Generated by Django 4.1.7 on 2026-10-18 14:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_dynamicindex'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DynamicColumnMigration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('column', models.CharField(max_length=63)),
+                ('old_type', models.CharField(choices=[('c', 'character'), ('b', 'boolean'), ('i', 'integer')], max_length=1)),
+                ('new_type', models.CharField(choices=[('c', 'character'), ('b', 'boolean'), ('i', 'integer')], max_length=1)),
+                ('state', models.CharField(choices=[('backfill', 'backfill'), ('swap', 'swap'), ('done', 'done'), ('failed', 'failed')], default='backfill', max_length=8)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('max_id', models.BigIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('table_def', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='column_migrations', to='api.dynamictable')),
+            ],
+        ),
+    ]
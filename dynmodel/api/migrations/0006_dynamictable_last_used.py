@@ -0,0 +1,18 @@
+# Generated by Django 4.1.7 on 2026-10-18 14:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_dynamiccolumnmigration'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dynamictable',
+            name='last_used',
+            field=models.DateTimeField(db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.7 on 2026-10-18 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_dynamictable_last_used'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dynamictable',
+            name='data_version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
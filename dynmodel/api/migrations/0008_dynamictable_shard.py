@@ -0,0 +1,18 @@
+# Generated by Django 4.1.7 on 2026-10-18 13:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_dynamictable_data_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dynamictable',
+            name='shard',
+            field=models.CharField(db_index=True, default='default', max_length=63),
+        ),
+    ]
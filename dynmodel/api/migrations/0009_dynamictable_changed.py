@@ -0,0 +1,18 @@
+# Generated by Django 4.1.7 on 2026-10-18 13:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_dynamictable_shard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dynamictable',
+            name='changed',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
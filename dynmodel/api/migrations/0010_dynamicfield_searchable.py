@@ -0,0 +1,18 @@
+# Generated by Django 4.1.7 on 2026-10-18 13:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_dynamictable_changed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dynamicfield',
+            name='searchable',
+            field=models.BooleanField(default=False),
+        ),
+    ]
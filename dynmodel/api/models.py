@@ -2,8 +2,16 @@ from django.db import models
 
 
 class DynamicTable(models.Model):
-    # class with just id column
-    pass
+    # bumped on every schema change, workers compare it with version of cached model class
+    schema_version = models.PositiveIntegerField(default=0)
+    # bumped after rows are written, together with schema version it identifies state of table data
+    data_version = models.PositiveBigIntegerField(default=0)
+    # time of last change of rows or schema, rows of recently changed table are read from primary
+    changed = models.DateTimeField(null=True)
+    # updated at most once per LAST_USED_RESOLUTION by every worker, orders startup warm up
+    last_used = models.DateTimeField(null=True, db_index=True)
+    # database alias of dynamic table, one of SHARDS
+    shard = models.CharField(max_length=63, default='default', db_index=True)
 
 
 TYPE_DEFINITIONS = [('c', 'character',), ('b', 'boolean',), ('i', 'integer')]
@@ -13,7 +21,36 @@ class DynamicField(models.Model):
 
     name = models.CharField(max_length=63)
     fld_type = models.CharField(max_length=1, choices=TYPE_DEFINITIONS)
+    # character column included in full text index of table
+    searchable = models.BooleanField(default=False)
     table_def = models.ForeignKey(DynamicTable, on_delete=models.CASCADE, related_name="fields")
 
     class Meta:
         unique_together = (("name", "table_def"),)
+
+
+class DynamicIndex(models.Model):
+    # secondary index of dynamic table, unique one is created as unique constraint
+    name = models.CharField(max_length=63)
+    fields = models.JSONField()
+    unique = models.BooleanField(default=False)
+    table_def = models.ForeignKey(DynamicTable, on_delete=models.CASCADE, related_name="indexes")
+
+    class Meta:
+        unique_together = (("name", "table_def"),)
+
+
+MIGRATION_STATES = [('backfill', 'backfill'), ('swap', 'swap'), ('done', 'done'), ('failed', 'failed')]
+
+
+class DynamicColumnMigration(models.Model):
+    # online change of column type, progress is stored so interrupted migration can be resumed
+    column = models.CharField(max_length=63)
+    old_type = models.CharField(max_length=1, choices=TYPE_DEFINITIONS)
+    new_type = models.CharField(max_length=1, choices=TYPE_DEFINITIONS)
+    state = models.CharField(max_length=8, choices=MIGRATION_STATES, default='backfill')
+    last_id = models.BigIntegerField(default=0)
+    max_id = models.BigIntegerField(default=0)
+    error = models.TextField(blank=True)
+    updated = models.DateTimeField(auto_now=True)
+    table_def = models.ForeignKey(DynamicTable, on_delete=models.CASCADE, related_name="column_migrations")
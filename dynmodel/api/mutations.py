@@ -0,0 +1,48 @@
+from django.db import IntegrityError, models, transaction
+
+
+def id_batches(rows: models.QuerySet, batch_size: int):
+    # id ranges of batch_size matching rows, each one is written by its own statement and transaction,
+    # so locks of huge update are held for one batch only, bounds are real ids, so gaps give no empty batches
+    ids = rows.order_by('id').values_list('id', flat=True)
+    low = ids.first()
+
+    while low is not None:
+        # next bound is read before batch is written, rows written by it may stop matching the filter
+        high = next(iter(ids.filter(id__gte=low)[batch_size:batch_size + 1]), None)
+        yield rows.filter(id__gte=low) if high is None else rows.filter(id__gte=low, id__lt=high)
+        low = high
+
+
+def apply_batched(rows: models.QuerySet, write, batch_size: int = None) -> dict:
+    # write(rows) runs single UPDATE or DELETE and returns affected row count
+    # unique index violation stops writing, batches written before it stay committed and are counted
+    rows = rows.order_by()
+
+    if not batch_size:
+        try:
+            with transaction.atomic(using=rows.db):
+                return {'rows': write(rows), 'batches': 1}
+        except IntegrityError as exc:
+            return {'rows': 0, 'batches': 0, 'error': str(exc)}
+
+    count = 0
+    batches = 0
+    for batch in id_batches(rows, batch_size):
+        try:
+            with transaction.atomic(using=rows.db):
+                count += write(batch)
+        except IntegrityError as exc:
+            return {'rows': count, 'batches': batches, 'error': str(exc)}
+        batches += 1
+
+    return {'rows': count, 'batches': batches}
+
+
+def update_rows(rows: models.QuerySet, values: dict, batch_size: int = None) -> dict:
+    return apply_batched(rows, lambda batch: batch.update(**values), batch_size)
+
+
+def delete_rows(rows: models.QuerySet, batch_size: int = None) -> dict:
+    # dynamic models have no relations nor delete signals, so delete is single statement
+    return apply_batched(rows, lambda batch: batch.delete()[0], batch_size)
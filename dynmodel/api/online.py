@@ -0,0 +1,171 @@
+import logging
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import DataError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .cache import model_cache
+from .models import DynamicColumnMigration, DynamicField, DynamicIndex, DynamicTable
+
+logger = logging.getLogger(__name__)
+
+
+class OnlineColumnMigration:
+    # changes column type on PostgreSQL without long table lock
+    # new values go to shadow column kept in sync by trigger, old rows are backfilled in id ranges
+    # and the columns are swapped in one short transaction at the end, every step can be resumed
+    def __init__(self, mdl, migration: DynamicColumnMigration):
+        qn = mdl.db.ops.quote_name
+
+        self.mdl = mdl
+        self.db = mdl.db
+        self.migration = migration
+        self.table = qn(mdl.model_name)
+        self.column = qn(migration.column)
+        self.shadow = qn(f'shadow__{migration.id}')
+        self.trigger = qn(f'{mdl.model_name}_shadow_{migration.id}')
+        self.db_type = mdl._convert_to_field(migration.new_type, migration.column).db_type(self.db)
+
+    def atomic(self) -> ExitStack:
+        # metadata on default database and table on its shard are committed together
+        stack = ExitStack()
+        stack.enter_context(transaction.atomic())
+        stack.enter_context(transaction.atomic(using=self.db.alias))
+
+        return stack
+
+    @classmethod
+    def start(cls, mdl, column: str, old_type: str, new_type: str) -> 'OnlineColumnMigration':
+        with transaction.atomic(), transaction.atomic(using=mdl.db.alias):
+            migration = DynamicColumnMigration.objects.create(
+                table_def_id=mdl.model_id, column=column, old_type=old_type, new_type=new_type
+            )
+            online = cls(mdl, migration)
+
+            # nullable column without default and trigger creation need only short locks
+            with online.db.cursor() as cursor:
+                cursor.execute(f'ALTER TABLE {online.table} ADD COLUMN {online.shadow} {online.db_type} NULL')
+                cursor.execute(
+                    f'CREATE FUNCTION {online.trigger}() RETURNS trigger AS $$ BEGIN '
+                    f'NEW.{online.shadow} := NEW.{online.column}::{online.db_type}; RETURN NEW; '
+                    f'END $$ LANGUAGE plpgsql'
+                )
+                cursor.execute(
+                    f'CREATE TRIGGER {online.trigger} BEFORE INSERT OR UPDATE ON {online.table} '
+                    f'FOR EACH ROW EXECUTE FUNCTION {online.trigger}()'
+                )
+
+                # rows above max id are written after trigger exists, so they don't need backfill
+                cursor.execute(f'SELECT max(id) FROM {online.table}')
+                migration.max_id = cursor.fetchone()[0] or 0
+
+            migration.save(update_fields=['max_id', 'updated'])
+
+        logger.info('Started online type change of %s.%s, %d rows to backfill',
+                    mdl.model_name, column, migration.max_id)
+
+        return online
+
+    def run(self) -> None:
+        try:
+            if self.migration.state == 'backfill':
+                self._backfill()
+
+            if self.migration.state == 'swap':
+                self._build_indexes()
+                self._swap()
+        except DataError as exc:
+            # values which can't be converted end here, other errors just leave migration pending
+            self._fail(exc)
+            raise
+
+    def _backfill(self) -> None:
+        chunk_size = settings.DYNAMIC_MODELS['ONLINE_BACKFILL_CHUNK']
+        migration = self.migration
+
+        while migration.last_id < migration.max_id:
+            upper = min(migration.last_id + chunk_size, migration.max_id)
+
+            with self.atomic(), self.db.cursor() as cursor:
+                cursor.execute(
+                    f'UPDATE {self.table} SET {self.shadow} = {self.column}::{self.db_type} '
+                    f'WHERE id > %s AND id <= %s',
+                    [migration.last_id, upper]
+                )
+                migration.last_id = upper
+                migration.save(update_fields=['last_id', 'updated'])
+
+            logger.info('Backfilled %s.%s up to id %d of %d',
+                        self.mdl.model_name, migration.column, migration.last_id, migration.max_id)
+
+        migration.state = 'swap'
+        migration.save(update_fields=['state', 'updated'])
+
+    def _indexes(self) -> list[DynamicIndex]:
+        indexes = DynamicIndex.objects.filter(table_def_id=self.mdl.model_id)
+        return [index for index in indexes if self.migration.column in index.fields]
+
+    def _build_indexes(self) -> None:
+        # indexes are built on shadow column upfront, so the swap only renames them
+        qn = self.db.ops.quote_name
+        concurrently = 'CONCURRENTLY ' if not self.db.in_atomic_block else ''
+
+        with self.db.cursor() as cursor:
+            for index in self._indexes():
+                name = qn(f'{index.name}_shadow')
+                columns = [self.shadow if col == self.migration.column else qn(col) for col in index.fields]
+                columns = ', '.join(columns)
+                unique = 'UNIQUE ' if index.unique else ''
+
+                # leftover of interrupted build is invalid and has to be dropped
+                cursor.execute(f'DROP INDEX {concurrently}IF EXISTS {name}')
+                cursor.execute(f'CREATE {unique}INDEX {concurrently}{name} ON {self.table} ({columns})')
+
+    def _swap(self) -> None:
+        qn = self.db.ops.quote_name
+        migration = self.migration
+
+        with self.atomic(), self.db.cursor() as cursor:
+            # lock waiting behind long query would block all traffic, on timeout migration stays in swap state
+            lock_timeout = settings.DYNAMIC_MODELS['ONLINE_SWAP_LOCK_TIMEOUT']
+            cursor.execute('SET LOCAL lock_timeout = %s', [lock_timeout])
+            cursor.execute(f'LOCK TABLE {self.table} IN ACCESS EXCLUSIVE MODE')
+            cursor.execute(f'DROP TRIGGER {self.trigger} ON {self.table}')
+            cursor.execute(f'DROP FUNCTION {self.trigger}()')
+            cursor.execute(f'ALTER TABLE {self.table} DROP COLUMN {self.column} CASCADE')
+            cursor.execute(f'ALTER TABLE {self.table} RENAME COLUMN {self.shadow} TO {self.column}')
+
+            for index in self._indexes():
+                name = qn(index.name)
+                cursor.execute(f'ALTER INDEX {qn(index.name + "_shadow")} RENAME TO {name}')
+                if index.unique:
+                    constraint = f'ADD CONSTRAINT {name} UNIQUE USING INDEX {name}'
+                    cursor.execute(f'ALTER TABLE {self.table} {constraint}')
+
+            DynamicField.objects.filter(table_def_id=self.mdl.model_id, name=migration.column).update(
+                fld_type=migration.new_type
+            )
+            DynamicTable.objects.filter(id=self.mdl.model_id).update(
+                schema_version=F('schema_version') + 1, changed=timezone.now()
+            )
+
+            migration.state = 'done'
+            migration.save(update_fields=['state', 'updated'])
+
+        model_cache.invalidate(self.mdl.model_id)
+        logger.info('Finished online type change of %s.%s', self.mdl.model_name, migration.column)
+
+    def _fail(self, exc: DataError) -> None:
+        with self.atomic(), self.db.cursor() as cursor:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {self.trigger} ON {self.table}')
+            cursor.execute(f'DROP FUNCTION IF EXISTS {self.trigger}()')
+            cursor.execute(f'ALTER TABLE {self.table} DROP COLUMN IF EXISTS {self.shadow}')
+
+            self.migration.state = 'failed'
+            self.migration.error = str(exc)
+            self.migration.save(update_fields=['state', 'error', 'updated'])
+
+        logger.error('Online type change of %s.%s failed: %s',
+                     self.mdl.model_name, self.migration.column, exc)
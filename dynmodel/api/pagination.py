@@ -0,0 +1,78 @@
+from django.conf import settings
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+# LIMIT and OFFSET are bigint in databases
+MAX_OFFSET = 2 ** 63 - 1
+
+
+class RowCursorPagination(CursorPagination):
+    # keyset pagination on primary key, cursor is opaque token in 'next'/'previous' links
+    # rows are paginated only when 'page_size' or 'cursor' is passed
+    ordering = 'id'
+    page_size = None
+    page_size_query_param = 'page_size'
+
+    @property
+    def max_page_size(self) -> int:
+        return settings.DYNAMIC_MODELS['ROWS_MAX_PAGE_SIZE']
+
+    def get_page_size(self, request):
+        page_size = super().get_page_size(request)
+
+        if page_size is None and self.cursor_query_param in request.query_params:
+            return settings.DYNAMIC_MODELS['ROWS_PAGE_SIZE']
+
+        return page_size
+
+
+class SearchPagination(BasePagination):
+    # ranked rows can't be paginated by key, so pages are numbered, matching rows are not counted,
+    # one row over page size tells whether there is next page
+    page_query_param = 'page'
+    page_size_query_param = 'page_size'
+
+    def paginate_queryset(self, queryset, request, view=None) -> list:
+        self.request = request
+        self.page = self.get_int(self.page_query_param, 1)
+        page_size = self.get_int(self.page_size_query_param, settings.DYNAMIC_MODELS['ROWS_PAGE_SIZE'])
+        self.page_size = min(page_size, settings.DYNAMIC_MODELS['ROWS_MAX_PAGE_SIZE'])
+
+        offset = (self.page - 1) * self.page_size
+        if offset + self.page_size + 1 > MAX_OFFSET:
+            # like in page number pagination of DRF
+            raise NotFound('Invalid page.')
+
+        rows = list(queryset[offset:offset + self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+
+        return rows[:self.page_size]
+
+    def get_int(self, param: str, default: int) -> int:
+        try:
+            value = int(self.request.query_params[param])
+        except (KeyError, ValueError):
+            return default
+
+        return value if value > 0 else default
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+
+        return replace_query_param(self.request.build_absolute_uri(), self.page_query_param, self.page + 1)
+
+    def get_previous_link(self):
+        if self.page == 1:
+            return None
+
+        url = self.request.build_absolute_uri()
+        if self.page == 2:
+            return remove_query_param(url, self.page_query_param)
+
+        return replace_query_param(url, self.page_query_param, self.page - 1)
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'previous': self.get_previous_link(), 'results': data})
@@ -0,0 +1,30 @@
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class NDJSONParser(BaseParser):
+    # newline delimited JSON, one object per line, empty lines are skipped
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        rows = []
+
+        if stream is None:
+            return rows
+
+        # bytes are split on '\n' only, unicode line separators can be part of JSON strings
+        for line_no, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+
+            try:
+                rows.append(json.loads(line.decode(encoding)))
+            except ValueError as exc:
+                raise ParseError(f'NDJSON parse error in line {line_no} - {exc}')
+
+        return rows
@@ -0,0 +1,86 @@
+import os
+import sys
+import threading
+
+from django.apps.registry import Apps
+from django.contrib import admin
+
+
+class ModelRegistry:
+    # app registry of dynamic model classes, separate from the global one, so registering and dropping
+    # classes never expires caches of project models; it holds only the newest class of every table
+    # and classes dropped from model cache are removed, so it doesn't grow with schema updates
+    app_label = 'api'
+
+    def __init__(self):
+        self.apps = Apps()
+        self._admin_names = set()
+        self._lock = threading.Lock()
+
+        self.registered = 0
+        self.unregistered = 0
+
+    def _models(self) -> dict:
+        return self.apps.all_models[self.app_label]
+
+    def discard(self, model_name: str) -> None:
+        # drops current class of the table, when it's superseded or no longer cached
+        model_cls = self._models().get(model_name.lower())
+        if model_cls is not None:
+            self.unregister(model_cls)
+
+    def add(self, model_cls) -> None:
+        with self._lock:
+            self.registered += 1
+
+        # admin keeps showing table after its class is rebuilt
+        if model_cls._meta.model_name in self._admin_names and not admin.site.is_registered(model_cls):
+            admin.site.register(model_cls)
+
+    def register_admin(self, model_cls) -> None:
+        self._admin_names.add(model_cls._meta.model_name)
+
+        if not admin.site.is_registered(model_cls):
+            admin.site.register(model_cls)
+
+    def unregister(self, model_cls) -> None:
+        name = model_cls._meta.model_name
+
+        with self._lock:
+            models = self._models()
+            if models.get(name) is model_cls:
+                del models[name]
+                self.apps.clear_cache()
+                self.unregistered += 1
+
+        if admin.site.is_registered(model_cls):
+            admin.site.unregister(model_cls)
+
+    def stats(self) -> dict[str, int]:
+        models = list(self._models().values())
+
+        return {
+            'models': len(models),
+            'admin_models': sum(admin.site.is_registered(model_cls) for model_cls in models),
+            'registered': self.registered,
+            'unregistered': self.unregistered,
+            'approx_bytes': sum(self._approx_size(model_cls) for model_cls in models),
+            'rss_bytes': self._rss(),
+        }
+
+    def _approx_size(self, model_cls) -> int:
+        size = sys.getsizeof(model_cls) + sys.getsizeof(vars(model_cls))
+        size += sys.getsizeof(vars(model_cls._meta))
+
+        return size + sum(sys.getsizeof(vars(field)) for field in model_cls._meta.fields)
+
+    def _rss(self) -> int:
+        # resident memory of the worker, Linux only
+        try:
+            with open('/proc/self/statm') as statm:
+                return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError, AttributeError):
+            return None
+
+
+model_registry = ModelRegistry()
@@ -0,0 +1,10 @@
+from rest_framework import renderers
+
+from .metrics import RENDER_SECONDS
+
+
+class JSONRenderer(renderers.JSONRenderer):
+    # JSON encoding is timed separately from the view, it runs after view returns
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with RENDER_SECONDS.time():
+            return super().render(data, accepted_media_type, renderer_context)
@@ -0,0 +1,88 @@
+import asyncio
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import markcoroutinefunction
+from django.conf import settings
+from django.utils import timezone
+
+# cookie with time until which client reads from primary, set after its writes
+PIN_COOKIE = 'dynmodel_primary_until'
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# set by middleware for every request, True while client reads its own writes
+_pinned = ContextVar('dynmodel_pinned', default=False)
+
+
+def pin(pinned: bool = True) -> None:
+    _pinned.set(pinned)
+
+
+def is_pinned() -> bool:
+    return _pinned.get()
+
+
+def replicas(alias: str) -> list[str]:
+    return settings.DYNAMIC_MODELS['REPLICAS'].get(alias, [])
+
+
+def is_replica(alias: str) -> bool:
+    return any(alias in aliases for aliases in settings.DYNAMIC_MODELS['REPLICAS'].values())
+
+
+def read_alias(primary: str, changed=None) -> str:
+    # random replica of database, primary while client is pinned or data changed within the window,
+    # replica might not have them yet
+    choices = replicas(primary)
+    if not choices or is_pinned():
+        return primary
+
+    window = settings.DYNAMIC_MODELS['PRIMARY_READ_SECONDS']
+    if changed is not None and (timezone.now() - changed).total_seconds() < window:
+        return primary
+
+    return random.choice(choices)
+
+
+class ReadYourWritesMiddleware:
+    # pins reads of client to primary databases for PRIMARY_READ_SECONDS after its write or schema change,
+    # state is kept in cookie, so it works across workers
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        self.pin(request)
+        return self.remember(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        self.pin(request)
+        return self.remember(request, await self.get_response(request))
+
+    def pin(self, request) -> None:
+        # every request sets its own state, worker threads are reused
+        try:
+            until = float(request.COOKIES.get(PIN_COOKIE, 0))
+        except ValueError:
+            until = 0
+
+        pin(request.method not in SAFE_METHODS or until > time.time())
+
+    def remember(self, request, response):
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            window = settings.DYNAMIC_MODELS['PRIMARY_READ_SECONDS']
+            response.set_cookie(PIN_COOKIE, f'{time.time() + window:.3f}', max_age=window,
+                                httponly=True, samesite='Lax')
+
+        return response
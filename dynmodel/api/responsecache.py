@@ -0,0 +1,73 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+from django.utils.cache import get_conditional_response
+
+from .metrics import RESPONSE_CACHE_REQUESTS
+
+
+def table_etag(mdl) -> str:
+    # weak, the same data are rendered differently by format and pagination links
+    return f'W/"{mdl.model_id}-{mdl.schema_version}-{mdl.data_version}"'
+
+
+def not_modified(request, mdl):
+    # 304 answer when client has current version, nothing but table definition row is read
+    return get_conditional_response(request, etag=table_etag(mdl))
+
+
+def cache_key(request, mdl) -> str:
+    # old versions are never asked again, they expire or are culled by cache size limit
+    # host isn't part of the key, its validation would fail requests made without one
+    url = f'{request.get_full_path()}{request.accepted_media_type}'
+    digest = hashlib.sha1(url.encode()).hexdigest()
+
+    return f'dynmodel:{mdl.model_id}:{mdl.schema_version}:{mdl.data_version}:{digest}'
+
+
+def cached_response(request, mdl, view):
+    # view() returns DRF Response of current table version, JSON ones are rendered here and
+    # kept in RESPONSE_CACHE cache, so repeated poll costs one cache lookup
+    response = not_modified(request, mdl)
+    if response is not None:
+        return response
+
+    alias = settings.DYNAMIC_MODELS['RESPONSE_CACHE']
+    cacheable = alias and request.accepted_renderer.format == 'json'
+
+    cached = caches[alias].get(cache_key(request, mdl)) if cacheable else None
+    if cached is not None:
+        RESPONSE_CACHE_REQUESTS.inc(result='hit')
+        response = cached_content(*cached)
+    else:
+        response = view()
+
+        if cacheable and response.status_code == 200:
+            RESPONSE_CACHE_REQUESTS.inc(result='miss')
+            render(request, response)
+
+            if len(response.content) <= settings.DYNAMIC_MODELS['RESPONSE_CACHE_MAX_BYTES']:
+                caches[alias].set(cache_key(request, mdl), (response.content, response['Content-Type']))
+
+    if response.status_code == 200:
+        response['ETag'] = table_etag(mdl)
+
+    return response
+
+
+def render(request, response: Response) -> None:
+    # the same what DRF does after view returns, rendered response is not rendered again
+    response.accepted_renderer = request.accepted_renderer
+    response.accepted_media_type = request.accepted_media_type
+    response.renderer_context = {'request': request, 'response': response}
+    response.render()
+
+
+def cached_content(content: bytes, content_type: str) -> Response:
+    response = Response()
+    response.content = content
+    response['Content-Type'] = content_type
+
+    return response
@@ -0,0 +1,141 @@
+from django.conf import settings
+from django.db import connections, models
+from django.db.models.expressions import RawSQL
+
+# tsvector column of PostgreSQL tables, table definition rejects column names with '__', so it never clashes
+VECTOR_COLUMN = 'search__vector'
+
+
+def fts_table(model_cls: models.Model) -> str:
+    # FTS5 index of SQLite table, it keeps no copy of text, content is read from the table itself
+    return f'{model_cls._meta.db_table}__search'
+
+
+def fts_query(query: str) -> str:
+    # every word as FTS5 string, so quotes and operators in user input can't break query syntax
+    return ' '.join('"' + word.replace('"', '""') + '"' for word in query.split())
+
+
+def create_search(schema_editor, model_cls: models.Model, columns: list[str]) -> None:
+    # full text index of columns, database keeps it in sync with every write of rows
+    if not columns:
+        return
+
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        _create_vector(schema_editor, model_cls, columns)
+    elif vendor == 'sqlite':
+        _create_fts(schema_editor, model_cls, columns)
+    else:
+        raise ValueError(f'Full text search is not supported on {vendor}')
+
+
+def drop_search(schema_editor, model_cls: models.Model) -> None:
+    qn = schema_editor.quote_name
+    table = model_cls._meta.db_table
+
+    if schema_editor.connection.vendor == 'postgresql':
+        # GIN index goes away with the column
+        schema_editor.execute(f'ALTER TABLE {qn(table)} DROP COLUMN IF EXISTS {qn(VECTOR_COLUMN)}')
+    elif schema_editor.connection.vendor == 'sqlite':
+        for action in ('insert', 'update', 'delete'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {qn(f"{fts_table(model_cls)}_{action}")}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {qn(fts_table(model_cls))}')
+
+
+def _create_vector(schema_editor, model_cls: models.Model, columns: list[str]) -> None:
+    # generated column is computed on every insert and update, COPY included
+    qn = schema_editor.quote_name
+    table = model_cls._meta.db_table
+    config = schema_editor.quote_value(settings.DYNAMIC_MODELS['SEARCH_CONFIG'])
+    vector = ' || '.join(
+        f"to_tsvector({config}::regconfig, coalesce({qn(model_cls._meta.get_field(name).column)}, ''))"
+        for name in columns
+    )
+
+    column = qn(VECTOR_COLUMN)
+
+    schema_editor.execute(
+        f'ALTER TABLE {qn(table)} ADD COLUMN {column} tsvector GENERATED ALWAYS AS ({vector}) STORED'
+    )
+    schema_editor.execute(f'CREATE INDEX {qn(f"{table}_search")} ON {qn(table)} USING gin ({column})')
+
+
+def _create_fts(schema_editor, model_cls: models.Model, columns: list[str]) -> None:
+    # external content FTS5 table is updated by triggers, existing rows are indexed by rebuild
+    qn = schema_editor.quote_name
+    table = qn(model_cls._meta.db_table)
+    fts = qn(fts_table(model_cls))
+    names = [qn(model_cls._meta.get_field(name).column) for name in columns]
+    new = ', '.join(['new.id'] + [f'new.{name}' for name in names])
+    old = ', '.join(['old.id'] + [f'old.{name}' for name in names])
+    names = ', '.join(names)
+    insert = f'INSERT INTO {fts} (rowid, {names}) VALUES ({new});'
+    delete = f"INSERT INTO {fts} ({fts}, rowid, {names}) VALUES ('delete', {old});"
+
+    content = schema_editor.quote_value(model_cls._meta.db_table)
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE {fts} USING fts5({names}, content={content}, content_rowid='id')"
+    )
+    for action, body in (('insert', insert), ('update', delete + insert), ('delete', delete)):
+        trigger = qn(f'{fts_table(model_cls)}_{action}')
+        schema_editor.execute(f'CREATE TRIGGER {trigger} AFTER {action.upper()} ON {table} BEGIN {body} END')
+    schema_editor.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+
+class RankedRows:
+    # SQLite search result, page of rowids with rank is read from FTS5 index by one query ordered by rank,
+    # only rows of that page are read from the table, so rank isn't looked up again for every match
+    def __init__(self, rows: models.QuerySet, fts: str, query: str, fields: tuple = ()):
+        self.rows = rows
+        self.fts = fts
+        self.query = query
+        self.fields = fields
+
+    def values(self, *fields) -> 'RankedRows':
+        return RankedRows(self.rows, self.fts, self.query, fields)
+
+    def __getitem__(self, page: slice) -> list[dict]:
+        offset = page.start or 0
+        limit = -1 if page.stop is None else page.stop - offset
+
+        # FTS5 rank is bm25 score, lower is better
+        with connections[self.rows.db].cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid, -rank FROM {self.fts} WHERE {self.fts} MATCH %s '
+                f'ORDER BY rank, rowid LIMIT %s OFFSET %s',
+                [self.query, limit, offset]
+            )
+            ranks = dict(cursor.fetchall())
+
+        fields = dict.fromkeys(name for name in ('id', *self.fields) if name != 'rank')
+        rows = {row['id']: row for row in self.rows.filter(id__in=ranks).values(*fields)}
+
+        # row deleted after index was read is skipped
+        return [dict(rows[id], rank=rank) for id, rank in ranks.items() if id in rows]
+
+
+def search_rows(model_cls: models.Model, query: str) -> models.QuerySet | RankedRows:
+    # rows matching query annotated with rank, best first, match is looked up in full text index
+    if not model_cls._search:
+        raise ValueError('Table has no searchable columns')
+
+    if not query.strip():
+        raise ValueError('Search query "q" is required')
+
+    # replica is chosen once, so query and its SQL dialect go to the same database
+    rows = model_cls.objects.all()
+    rows = rows.using(rows.db)
+    connection = connections[rows.db]
+    qn = connection.ops.quote_name
+
+    if connection.vendor != 'postgresql':
+        return RankedRows(rows, qn(fts_table(model_cls)), fts_query(query))
+
+    vector = f'{qn(model_cls._meta.db_table)}.{qn(VECTOR_COLUMN)}'
+    tsquery = 'websearch_to_tsquery(%s::regconfig, %s)'
+    params = [settings.DYNAMIC_MODELS['SEARCH_CONFIG'], query]
+    match = RawSQL(f'{vector} @@ {tsquery}', params, output_field=models.BooleanField())
+    rank = RawSQL(f'ts_rank({vector}, {tsquery})', params, output_field=models.FloatField())
+
+    return rows.filter(match).annotate(rank=rank).order_by('-rank', 'id')
@@ -1,10 +1,22 @@
+import copy
+
 from rest_framework import serializers
 
 
 def generic_serializer(model_instance):
     class GenericSerializer(serializers.ModelSerializer):
+        # field map built by model introspection, shared by all instances of this serializer class
+        _fields_template = None
+
         class Meta:
             model = model_instance
             fields = '__all__'
 
-    return GenericSerializer
\ No newline at end of file
+        def get_fields(self):
+            cls = type(self)
+            if cls._fields_template is None:
+                cls._fields_template = super().get_fields()
+
+            return copy.deepcopy(cls._fields_template)
+
+    return GenericSerializer
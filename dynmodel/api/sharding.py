@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Count
+
+from .models import DynamicTable
+from .replicas import is_replica, read_alias
+
+
+def shards() -> list[str]:
+    return settings.DYNAMIC_MODELS['SHARDS']
+
+
+def place_tables(count: int) -> list[str]:
+    # databases of new tables, each one goes to shard with fewest tables, ties by order in settings
+    if len(shards()) == 1:
+        return shards() * count
+
+    load = dict.fromkeys(shards(), 0)
+    tables = DynamicTable.objects.filter(shard__in=shards()).values('shard').annotate(tables=Count('id'))
+    load.update((row['shard'], row['tables']) for row in tables)
+
+    placement = []
+    for _ in range(count):
+        shard = min(load, key=load.get)
+        load[shard] += 1
+        placement.append(shard)
+
+    return placement
+
+
+class DynamicTableRouter:
+    # rows and DDL of dynamic table go to database it is placed on, model class carries its alias,
+    # reads go to its replica unless client or table is pinned to primary,
+    # metadata and everything else stay on default database
+    def db_for_read(self, model, **hints):
+        shard = getattr(model, '_shard', None)
+        if shard is None:
+            return None
+
+        return read_alias(shard, model._changed)
+
+    def db_for_write(self, model, **hints):
+        return getattr(model, '_shard', None)
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # shards hold dynamic tables only, those are not created by migrations, replicas are read only
+        if db != DEFAULT_DB_ALIAS and db in shards():
+            return False
+
+        if is_replica(db):
+            return False
+
+        return None
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.db import models
+from rest_framework.utils.encoders import JSONEncoder
+
+from .metrics import ROWS_SERVED
+
+
+def ndjson_rows(rows: models.QuerySet, serializer_cls=None):
+    # server side cursor on PostgreSQL, memory usage doesn't depend on table size
+    # without serializer rows are dicts of values() queryset and are encoded as they are
+    chunk_size = settings.DYNAMIC_MODELS['STREAM_CHUNK_SIZE']
+    represent = serializer_cls().to_representation if serializer_cls else None
+    encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    lines = []
+
+    for obj in rows.iterator(chunk_size=chunk_size):
+        lines.append(encoder.encode(represent(obj) if represent else obj))
+
+        if len(lines) >= chunk_size:
+            ROWS_SERVED.inc(len(lines))
+            yield '\n'.join(lines) + '\n'
+            lines = []
+
+    if lines:
+        ROWS_SERVED.inc(len(lines))
+        yield '\n'.join(lines) + '\n'
@@ -1,7 +1,40 @@
+import gzip
+import io
+import json
+import threading
+import time
+import warnings
+from concurrent.futures import Future
+from datetime import timedelta
+
+from unittest import skipUnless
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib import admin
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection, connections
+from django.db.models import F
+from django.test import Client, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APITestCase
 
+from .benchmark import Benchmark, compare
+from .cache import model_cache
+from .dynamicmodel import DynamicModel
+from .groupcommit import Batch, GroupCommit
+from .importer import column_name, infer_type
+from .models import DynamicColumnMigration, DynamicField, DynamicIndex, DynamicTable
+from .metrics import REQUEST_QUERIES
+from .online import OnlineColumnMigration
+from .registry import model_registry
+from .replicas import PIN_COOKIE, is_pinned, is_replica, pin, read_alias
+
 
 class DynamicModelsTests(APITestCase):
     create_datamodel = {
@@ -51,6 +84,35 @@ class DynamicModelsTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertIn('id', response.data)
 
+    def test_create_tables(self):
+        create_url = reverse('create-tables')
+        datamodels = [
+            self.create_datamodel,
+            {"name": "character", "active": "boolean", "__indexes__": [{"fields": ["name"], "unique": True}]},
+            {f"col{i}": "integer" for i in range(20)},
+        ]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(create_url, datamodels, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data['ids']), 3)
+        inserts = [q for q in queries if q['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 3)
+
+        id = response.data['ids'][1]
+        rows_url = reverse('list-rows', args=[id])
+        self.client.post(rows_url, [{"name": "a", "active": True}], format='json')
+        response = self.client.post(rows_url, [{"name": "a"}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(rows_url).data, [{'id': 1, 'name': 'a', 'active': True}])
+
+        tables = DynamicTable.objects.count()
+        for datamodels in ([], {}, [{"make": "character"}, {"year": "float"}],
+                           [{"make": "character"}, {"make": "character", "__indexes__": ["year"]}]):
+            response = self.client.post(create_url, datamodels, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(DynamicTable.objects.count(), tables)
+
     def test_alter_table(self):
         create_url = reverse('create-table')
 
@@ -89,14 +151,23 @@ class DynamicModelsTests(APITestCase):
         response = self.client.post(create_url, self.error_datamodel, format='json')
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+        reserved = ({"a__b": "integer"}, {"id": "integer"},
+                    {"search__vector": "character", "make": "character", "__search__": ["make"]})
+        for datamodel in reserved:
+            response = self.client.post(create_url, datamodel, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('reserved', response.data['error'])
+        self.assertFalse(DynamicTable.objects.exists())
+
         create_url = reverse('create-table')
         response = self.client.post(create_url, self.create_datamodel, format='json')
         id = response.data['id']
 
         update_url = reverse('update-table', args=[id])
 
-        response = self.client.put(update_url, self.error_datamodel, format='json')
-        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        for datamodel in (self.error_datamodel, [1, 2], {}, {"__indexes__": []}):
+            response = self.client.put(update_url, datamodel, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
     def test_error_data(self):
         list_error_row_url = reverse('list-rows', args=[9999])
@@ -106,3 +177,1263 @@ class DynamicModelsTests(APITestCase):
         create_error_row_url = reverse('create-row', args=[9999])
         response = self.client.post(create_error_row_url, {}, format='json')
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class BulkInsertTests(APITestCase):
+    rows = [
+        {"make": "toyota", "model": "corolla", "year": 2012, "valid_license": True},
+        {"make": "mazda\ttab", "model": None, "year": "x"},
+        {"make": "mazda", "model": "cx-5\nline", "year": 2018, "valid_license": False},
+    ]
+
+    def setUp(self):
+        create_url = reverse('create-table')
+        response = self.client.post(create_url, DynamicModelsTests.create_datamodel, format='json')
+        self.rows_url = reverse('list-rows', args=[response.data['id']])
+
+    def test_partial_insert(self):
+        for use_copy in (True, False):
+            dm = dict(settings.DYNAMIC_MODELS, BULK_USE_COPY=use_copy, BULK_CHUNK_SIZE=1)
+            with self.settings(DYNAMIC_MODELS=dm):
+                response = self.client.post(self.rows_url, self.rows, format='json')
+
+            self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+            self.assertEqual(response.data['inserted'], 2)
+            self.assertEqual(len(response.data['ids']), 2)
+            self.assertEqual([e['index'] for e in response.data['errors']], [1])
+            self.assertIn('year', response.data['errors'][0]['errors'])
+
+        rows = self.client.get(self.rows_url).data
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[1]['model'], 'cx-5\nline')
+        self.assertIs(rows[1]['valid_license'], False)
+
+    def test_database_errors(self):
+        response = self.client.post(reverse('create-table'), IndexTests.datamodel, format='json')
+        rows_url = reverse('list-rows', args=[response.data['id']])
+        rows = [{"model": model} for model in ("a", "b", "a", "c", "b")]
+
+        # only duplicates of unique column fail, not the whole chunk
+        response = self.client.post(rows_url, rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data['inserted'], 3)
+        self.assertEqual([error['index'] for error in response.data['errors']], [2, 4])
+        self.assertIn('non_field_errors', response.data['errors'][0]['errors'])
+        self.assertEqual([row['model'] for row in self.client.get(rows_url).data], ['a', 'b', 'c'])
+
+        with self.settings(DYNAMIC_MODELS=dict(settings.DYNAMIC_MODELS, BULK_USE_COPY=False)):
+            response = self.client.post(rows_url, [{"model": "d"}, {"model": "a"}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1])
+
+    def test_atomic(self):
+        response = self.client.post(self.rows_url + '?atomic=true', self.rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['inserted'], 0)
+        self.assertEqual(len(self.client.get(self.rows_url).data), 0)
+
+    def test_ndjson(self):
+        body = '\n'.join(json.dumps(row) for row in self.rows if row['year'] != 'x')
+        response = self.client.post(self.rows_url, body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['inserted'], 2)
+        self.assertIn('rows_per_sec', response.data['stats'])
+
+        # raw line separators inside strings don't split rows
+        body = json.dumps({"make": "a\u2028b\u0085c"}, ensure_ascii=False) + '\r\n'
+        response = self.client.post(self.rows_url, body.encode(), content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.client.get(self.rows_url).data[-1]['make'], 'a\u2028b\u0085c')
+
+        for body in ('{"make": ', b'{"make": "\xff"}'):
+            response = self.client.post(self.rows_url, body, content_type='application/x-ndjson')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(DYNAMIC_MODELS=dict(settings.DYNAMIC_MODELS, GROUP_COMMIT=True))
+class GroupCommitTests(APITestCase):
+    def setUp(self):
+        response = self.client.post(reverse('create-table'), IndexTests.datamodel, format='json')
+        self.id = response.data['id']
+
+    def test_create_row(self):
+        create_url = reverse('create-row', args=[self.id])
+
+        response = self.client.post(create_url, {"make": "toyota", "model": "corolla"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['id'], 1)
+        self.assertEqual(DynamicModel(self.id).as_model().objects.get().model, 'corolla')
+
+        # unique index violation fails only its own row
+        response = self.client.post(create_url, {"make": "mazda", "model": "corolla"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('non_field_errors', response.data['error'])
+
+        response = self.client.post(create_url, {"year": "x"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('year', response.data['error'])
+
+        self.assertEqual(DynamicTable.objects.get(id=self.id).data_version, 1)
+
+    def test_failed_leader(self):
+        mdl = DynamicModel(self.id)
+        mdl.as_model()
+
+        class DeadLeader(GroupCommit):
+            def flush(self, mdl, batch):
+                pass
+
+        # row of batch which is never written is inserted alone after timeout
+        dm = dict(settings.DYNAMIC_MODELS, GROUP_COMMIT=True, GROUP_COMMIT_MAX_DELAY_MS=1,
+                  GROUP_COMMIT_WRITE_TIMEOUT_MS=1)
+        with self.settings(DYNAMIC_MODELS=dm):
+            self.assertEqual(DeadLeader().insert(mdl, {"make": "toyota", "model": "corolla"}), 1)
+        self.assertEqual(DynamicTable.objects.get(id=self.id).data_version, 1)
+
+        # cancelled row is skipped, failed bookkeeping after commit doesn't fail written rows
+        def bump_data_version():
+            raise DatabaseError('bump failed')
+
+        mdl.bump_data_version = bump_data_version
+        batch = Batch()
+        batch.rows = [{"make": "mazda", "model": "6"}, {"make": "honda", "model": "civic"}]
+        batch.futures = [Future(), Future()]
+        batch.futures[0].cancel()
+        with self.assertLogs('api.groupcommit', 'ERROR'):
+            GroupCommit().flush(mdl, batch)
+
+        self.assertEqual(batch.futures[1].result(0), 2)
+        makes = mdl.model_class.objects.order_by('id').values_list('make', flat=True)
+        self.assertEqual(list(makes), ['toyota', 'honda'])
+
+
+class ListRowsTests(APITestCase):
+    def setUp(self):
+        create_url = reverse('create-table')
+        response = self.client.post(create_url, DynamicModelsTests.create_datamodel, format='json')
+        self.id = response.data['id']
+        self.rows_url = reverse('list-rows', args=[self.id])
+        rows = [{"make": f"make{i}", "year": 2000 + i} for i in range(5)]
+        self.client.post(self.rows_url, rows, format='json')
+
+    def test_pagination(self):
+        response = self.client.get(self.rows_url, {'page_size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        years = [row['year'] for row in response.data['results']]
+
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            years.extend(row['year'] for row in response.data['results'])
+
+        self.assertEqual(years, [2000, 2001, 2002, 2003, 2004])
+
+    def test_filters(self):
+        def makes(params):
+            response = self.client.get(self.rows_url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            rows = response.data['results'] if 'page_size' in params else response.data
+            return [row['make'] for row in rows]
+
+        self.assertEqual(makes({'year__gte': 2001, 'year__lt': '2003'}), ['make1', 'make2'])
+        self.assertEqual(makes({'make__in': 'make0,make4', 'ordering': '-year'}), ['make4', 'make0'])
+        self.assertEqual(makes({'make__startswith': 'mak', 'model__isnull': 'true', 'year': 2003}), ['make3'])
+        self.assertEqual(makes({'valid_license__isnull': 'false'}), [])
+        self.assertEqual(makes({'ordering': '-year,-id'}), [f'make{i}' for i in (4, 3, 2, 1, 0)])
+
+        # pages are keyed by id, they can't follow other ordering
+        invalid = ({'color': 'red'}, {'year': 'x'}, {'valid_license__gt': 'true'}, {'ordering': 'color'},
+                   {'ordering': '--year'}, {'ordering': 'year', 'page_size': 2},
+                   {'ordering': 'year', 'cursor': 'x'})
+        for params in invalid:
+            response = self.client.get(self.rows_url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    async def test_stream_asgi(self):
+        # streamed content would query database in event loop
+        for url, params in ((self.rows_url, {'stream': 'true'}),
+                            (reverse('async-list-rows', args=[self.id]), {'stream': 'true'}),
+                            (reverse('export-table', args=[self.id]), {})):
+            response = await self.async_client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_501_NOT_IMPLEMENTED)
+            self.assertIn('ASGI', response.json()['error'])
+
+    def test_stream(self):
+        dm = dict(settings.DYNAMIC_MODELS, STREAM_CHUNK_SIZE=2)
+        with self.settings(DYNAMIC_MODELS=dm):
+            response = self.client.get(self.rows_url, {'stream': 'true'})
+            content = b''.join(response.streaming_content).decode()
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row['make'] for row in rows], [f'make{i}' for i in range(5)])
+        self.assertIsNone(rows[0]['model'])
+
+    def test_fast_read_output(self):
+        def contents(fast_read):
+            dm = dict(settings.DYNAMIC_MODELS, FAST_READ=fast_read)
+            with self.settings(DYNAMIC_MODELS=dm):
+                plain = self.client.get(self.rows_url, {'ordering': '-year'}).content
+                paged = self.client.get(self.rows_url, {'page_size': 2}).content
+                stream = b''.join(self.client.get(self.rows_url, {'stream': 'true'}).streaming_content)
+            return plain, paged, stream
+
+        self.assertEqual(contents(True), contents(False))
+
+    def test_update_delete(self):
+        def years():
+            return [row['year'] for row in self.client.get(self.rows_url).data]
+
+        response = self.client.patch(self.rows_url + '?year__gte=2003', {'model': 'new'}, format='json')
+        self.assertEqual(response.data, {'updated': 2, 'batches': 1})
+        response = self.client.get(self.rows_url, {'model': 'new'})
+        self.assertEqual([row['make'] for row in response.data], ['make3', 'make4'])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(self.rows_url + '?all=true&batch_size=2', {'year': 1}, format='json')
+        self.assertEqual(response.data, {'updated': 5, 'batches': 3})
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('UPDATE "dyntbl_')]), 3)
+
+        response = self.client.delete(self.rows_url + '?make__in=make0,make2,make9')
+        self.assertEqual(response.data, {'deleted': 2, 'batches': 1})
+        self.assertEqual(len(years()), 3)
+
+        # batches are bounded by ids of remaining rows, gaps don't add empty ones
+        response = self.client.patch(self.rows_url + '?all=true&batch_size=1', {'year': 2}, format='json')
+        self.assertEqual(response.data, {'updated': 3, 'batches': 3})
+
+        response = self.client.delete(self.rows_url + '?all=true&batch_size=10')
+        self.assertEqual(response.data, {'deleted': 3, 'batches': 1})
+        self.assertEqual(years(), [])
+
+    def test_update_delete_invalid(self):
+        for method, url, data in (
+            ('delete', '', None),
+            ('patch', '', {'year': 1}),
+            ('patch', '?year=1', {}),
+            ('patch', '?year=1', {'year': 'x'}),
+            ('patch', '?year=1', {'color': 'red'}),
+            ('patch', '?year=1', {'id': 7}),
+            ('delete', '?color=red', None),
+            ('delete', '?year=1&batch_size=0', None),
+        ):
+            response = getattr(self.client, method)(self.rows_url + url, data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, (method, url, data))
+
+        self.assertEqual(len(self.client.get(self.rows_url).data), 5)
+
+
+class AggregateTests(APITestCase):
+    def setUp(self):
+        create_url = reverse('create-table')
+        response = self.client.post(create_url, DynamicModelsTests.create_datamodel, format='json')
+        self.url = reverse('aggregate-table', args=[response.data['id']])
+        rows = [
+            {"make": "toyota", "year": 2012, "valid_license": True},
+            {"make": "mazda", "year": 2015, "valid_license": True},
+            {"make": "mazda", "year": 2018, "valid_license": False},
+            {"make": "mazda", "model": "cx-5"},
+        ]
+        self.client.post(reverse('list-rows', args=[response.data['id']]), rows, format='json')
+
+    def test_aggregate(self):
+        params = {'agg': 'count,year__sum,year__min,year__avg,model__count'}
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, params)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [
+            {'count': 4, 'year__sum': 6045, 'year__min': 2012, 'year__avg': 2015.0, 'model__count': 1}
+        ])
+
+    def test_group_by(self):
+        params = {'agg': 'count,year__max,valid_license__count_distinct', 'group_by': 'make',
+                  'ordering': '-count', 'year__gte': 2000}
+        response = self.client.get(self.url, params)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [
+            {'make': 'mazda', 'count': 2, 'year__max': 2018, 'valid_license__count_distinct': 2},
+            {'make': 'toyota', 'count': 1, 'year__max': 2012, 'valid_license__count_distinct': 1},
+        ])
+
+        response = self.client.get(self.url, {'group_by': 'make,valid_license'})
+        self.assertEqual(len(response.data['results']), 4)
+
+    def test_invalid(self):
+        for params in ({'agg': 'make__sum'}, {'agg': 'year__median'}, {'agg': 'color__count'},
+                       {'group_by': 'color'}, {'group_by': 'make', 'ordering': 'year'}, {'year': 'x'}):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        caches['responses'].clear()
+        response = self.client.post(reverse('create-table'), {"make": "character"}, format='json')
+        self.id = response.data['id']
+        self.rows_url = reverse('list-rows', args=[self.id])
+        self.client.post(self.rows_url, [{"make": "toyota"}, {"make": "mazda"}], format='json')
+
+    def get(self, url, etag=None, **params):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params, **headers)
+        table_queries = [q for q in queries if f'dyntbl_{self.id}' in q['sql']]
+        return response, table_queries
+
+    def test_etag(self):
+        response, _ = self.get(self.rows_url)
+        etag = response['ETag']
+
+        response, table_queries = self.get(self.rows_url, etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(table_queries, [])
+
+        response, _ = self.get(reverse('async-list-rows', args=[self.id]), etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        writes = (
+            lambda: self.client.post(reverse('create-row', args=[self.id]), {"make": "fiat"}, format='json'),
+            lambda: self.client.patch(self.rows_url + '?make=fiat', {"make": "kia"}, format='json'),
+            lambda: self.client.delete(self.rows_url + '?make=kia'),
+            lambda: self.client.put(reverse('update-table', args=[self.id]),
+                                    {"make": "character", "year": "integer"}, format='json'),
+        )
+        for write in writes:
+            self.assertLess(write().status_code, 300)
+            response, _ = self.get(self.rows_url, etag)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotEqual(response['ETag'], etag)
+            etag = response['ETag']
+
+        # failed write leaves version as it is
+        self.client.post(self.rows_url, [{"year": "x"}], format='json')
+        response, _ = self.get(self.rows_url, etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_response_cache(self):
+        aggregate_url = reverse('aggregate-table', args=[self.id])
+        for url, params in ((self.rows_url, {'ordering': '-make'}), (aggregate_url, {'group_by': 'make'})):
+            first, table_queries = self.get(url, **params)
+            self.assertTrue(table_queries)
+
+            cached, table_queries = self.get(url, **params)
+            self.assertEqual(table_queries, [])
+            self.assertEqual(cached.content, first.content)
+
+            self.client.post(self.rows_url, [{"make": "fiat"}], format='json')
+            response, table_queries = self.get(url, **params)
+            self.assertTrue(table_queries)
+            self.assertIn(b'fiat', response.content)
+
+        dm = dict(settings.DYNAMIC_MODELS, RESPONSE_CACHE=None)
+        with self.settings(DYNAMIC_MODELS=dm):
+            self.get(self.rows_url)
+            _, table_queries = self.get(self.rows_url)
+        self.assertTrue(table_queries)
+
+
+class SearchTests(APITestCase):
+    datamodel = {
+        "make": "character", "model": "character", "year": "integer", "__search__": ["make", "model"]
+    }
+
+    def setUp(self):
+        response = self.client.post(reverse('create-table'), self.datamodel, format='json')
+        self.id = response.data['id']
+        self.rows_url = reverse('list-rows', args=[self.id])
+        self.search_url = reverse('search-table', args=[self.id])
+
+        rows = [
+            {"make": "toyota", "model": "corolla", "year": 2012},
+            {"make": "mazda", "model": "cx-5", "year": 2018},
+            {"make": "toyota", "model": "toyota supra", "year": 1998},
+        ]
+        self.client.post(self.rows_url, rows, format='json')
+
+    def search(self, q, **params):
+        response = self.client.get(self.search_url, dict(params, q=q))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def test_search(self):
+        results = self.search('toyota')['results']
+        self.assertEqual([row['id'] for row in results], [3, 1])
+        self.assertGreater(results[0]['rank'], results[1]['rank'])
+        self.assertEqual(results[1]['model'], 'corolla')
+        self.assertEqual(self.search('toyota corolla')['results'][0]['id'], 1)
+        self.assertEqual(self.search('honda')['results'], [])
+
+        page = self.search('toyota', page_size=1)
+        self.assertEqual([row['id'] for row in page['results']], [3])
+        page = self.client.get(page['next']).json()
+        self.assertEqual([row['id'] for row in page['results']], [1])
+        self.assertIsNone(page['next'])
+        self.assertEqual(self.search('toyota', page=1000)['results'], [])
+        response = self.client.get(self.search_url, {'q': 'toyota', 'page': 99999999999999999})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        # index follows single row inserts, updates and deletes
+        create_url = reverse('create-row', args=[self.id])
+        self.client.post(create_url, {"make": "honda", "model": "civic"}, format='json')
+        self.client.patch(self.rows_url + '?model=corolla', {"make": "honda"}, format='json')
+        self.client.delete(self.rows_url + '?model=cx-5')
+        self.assertEqual([row['id'] for row in self.search('honda')['results']], [1, 4])
+        self.assertEqual(self.search('mazda')['results'], [])
+
+    def test_rank_cost(self):
+        # rank is read along with match, not looked up again for every matching row
+        rows = [{"make": "toyota", "model": str(i)} for i in range(50)]
+        self.client.post(self.rows_url, rows, format='json')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(len(self.search('toyota', page_size=2)['results']), 2)
+        self.assertTrue(any('toyota' in query['sql'] for query in queries))
+
+        explain = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+        for query in queries:
+            if query['sql'].startswith('SELECT'):
+                with connection.cursor() as cursor:
+                    cursor.execute(explain + query['sql'])
+                    plan = ' '.join(str(line[-1]) for line in cursor.fetchall())
+                self.assertNotIn('CORRELATED', plan)
+                self.assertNotIn('SubPlan', plan)
+
+    def test_update_table(self):
+        update_url = reverse('update-table', args=[self.id])
+
+        # searchable columns stay while they are character columns
+        datamodel = {"make": "character", "model": "character", "color": "character"}
+        response = self.client.put(update_url, datamodel, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(self.search('toyota')['results']), 2)
+
+        response = self.client.put(update_url, {"make": "integer", "model": "character"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        datamodel = {"make": "character", "model": "character", "__search__": ["model"]}
+        response = self.client.put(update_url, datamodel, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['id'] for row in self.search('toyota')['results']], [3])
+
+        response = self.client.put(update_url, {"make": "character", "__search__": []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(self.search_url, {'q': 'toyota'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.put(update_url, {"make": "character", "__search__": ["make"]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(self.search('toyota')['results']), 2)
+
+    def test_errors(self):
+        self.assertEqual(self.client.get(self.search_url).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(reverse('search-table', args=[0]), {'q': 'x'}).status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+        for search in (["year"], ["color"], "make", ["make", "make"]):
+            datamodel = dict(self.datamodel, __search__=search)
+            response = self.client.post(reverse('create-table'), datamodel, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ExportTests(APITestCase):
+    def setUp(self):
+        create_url = reverse('create-table')
+        response = self.client.post(create_url, DynamicModelsTests.create_datamodel, format='json')
+        self.url = reverse('export-table', args=[response.data['id']])
+        rows = [
+            {"make": "toyota", "model": 'say "hi",\nbye \\ ok', "year": 2012, "valid_license": True},
+            {"make": "mazda", "model": "", "valid_license": False},
+            {"make": "łada"},
+        ]
+        self.client.post(reverse('list-rows', args=[response.data['id']]), rows, format='json')
+
+    def export(self, params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv(self):
+        dm = dict(settings.DYNAMIC_MODELS, EXPORT_BUFFER_SIZE=16, STREAM_CHUNK_SIZE=1)
+        with self.settings(DYNAMIC_MODELS=dm):
+            response, content = self.export({})
+
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('.csv"', response['Content-Disposition'])
+        self.assertEqual(content.decode().splitlines()[0], 'id,make,model,year,valid_license')
+        self.assertEqual(content.decode().splitlines()[-1], '3,łada,,,')
+        self.assertIn('"say ""hi"",\nbye \\ ok",2012,t\n2,mazda,"",,f\n', content.decode())
+
+    def test_ndjson(self):
+        response, content = self.export({'output': 'ndjson', 'year__isnull': 'true', 'ordering': '-id'})
+
+        rows = [json.loads(line) for line in content.decode().splitlines()]
+        self.assertEqual(rows, [
+            {'id': 3, 'make': 'łada', 'model': None, 'year': None, 'valid_license': None},
+            {'id': 2, 'make': 'mazda', 'model': '', 'year': None, 'valid_license': False},
+        ])
+
+        _, content = self.export({'output': 'ndjson', 'make': 'toyota'})
+        self.assertEqual(json.loads(content)['model'], 'say "hi",\nbye \\ ok')
+
+    def test_gzip(self):
+        _, plain = self.export({'output': 'ndjson'})
+        response, content = self.export({'output': 'ndjson', 'compress': 'gzip'})
+
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual(gzip.decompress(content), plain)
+
+    def test_invalid(self):
+        for params in ({'output': 'xml'}, {'compress': 'zip'}, {'color': 'red'}):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ImportTests(APITestCase):
+    def upload(self, url, content, params=''):
+        file = SimpleUploadedFile('rows.csv', content.encode())
+        return self.client.post(url + params, {'file': file}, format='multipart')
+
+    def test_infer(self):
+        self.assertEqual(infer_type(['1', '', '-20']), 'i')
+        self.assertEqual(infer_type(['1', '3000000000']), 'c')
+        self.assertEqual(infer_type(['True', 'no', '']), 'b')
+        self.assertEqual(infer_type(['0', '1']), 'i')
+        self.assertEqual(infer_type(['', '']), 'c')
+        self.assertEqual(column_name(' Valid  License? '), 'valid_license')
+        self.assertEqual(column_name('2nd__name'), 'col_2nd_name')
+
+    def test_new_table(self):
+        content = '\ufeffid,Make,year,valid\n7,toyota,2012,true\n8,"mazda, ok",,f\n9,łada,1999\n'
+        dm = dict(settings.DYNAMIC_MODELS, BULK_CHUNK_SIZE=1)
+        with self.settings(DYNAMIC_MODELS=dm):
+            response = self.upload(reverse('import-table'), content)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['schema'],
+                         {'make': 'character', 'year': 'integer', 'valid': 'boolean'})
+        self.assertEqual((response.data['inserted'], response.data['rejected']), (2, 1))
+        self.assertEqual(response.data['errors'][0]['line'], 4)
+
+        response = self.client.get(reverse('list-rows', args=[response.data['id']]))
+        self.assertEqual([(row['make'], row['year'], row['valid']) for row in response.data],
+                         [('toyota', 2012, True), ('mazda, ok', None, False)])
+
+    def test_line_separators(self):
+        # unicode line separators are ordinary characters in CSV, only CR and LF end lines
+        content = 'make,model\r\na\u2028b,"c\x1cd\u0085e\r\nf"\r\n'
+        response = self.upload(reverse('import-table'), content)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((response.data['rows'], response.data['inserted']), (1, 1))
+
+        response = self.client.get(reverse('list-rows', args=[response.data['id']]))
+        rows = [(row['make'], row['model']) for row in response.data]
+        self.assertEqual(rows, [('a\u2028b', 'c\x1cd\u0085e\r\nf')])
+
+    def test_broken_new_table(self):
+        # invalid byte past first read buffer, table is already created and holds first chunks
+        content = b'make\n' + b'toyota\n' * 5000 + b'\xff\n'
+        dm = dict(settings.DYNAMIC_MODELS, BULK_CHUNK_SIZE=100, IMPORT_SAMPLE_ROWS=10)
+        with self.settings(DYNAMIC_MODELS=dm):
+            file = SimpleUploadedFile('rows.csv', content)
+            response = self.client.post(reverse('import-table'), {'file': file}, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(DynamicTable.objects.exists())
+        tables = connection.introspection.table_names()
+        self.assertFalse([name for name in tables if name.startswith('dyntbl_')])
+
+    def test_existing_table(self):
+        datamodel = DynamicModelsTests.create_datamodel
+        response = self.client.post(reverse('create-table'), datamodel, format='json')
+        url = reverse('import-rows', args=[response.data['id']])
+
+        content = 'make;year\ntoyota;2012\nmazda;new\nfiat;1990\n'
+        dm = dict(settings.DYNAMIC_MODELS, IMPORT_MAX_ERRORS=0)
+        with self.settings(DYNAMIC_MODELS=dm):
+            response = self.upload(url, content, '?delimiter=;')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([response.data[key] for key in ('rows', 'inserted', 'rejected')], [3, 2, 1])
+        self.assertEqual(response.data['errors'], [])
+
+        response = self.upload(url, 'make,color\ntoyota,red\n')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_invalid(self):
+        self.assertEqual(self.upload(reverse('import-table'), '').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.upload(reverse('import-table'), 'a,A\n1,2\n').status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.upload(reverse('import-rows', args=[999]), 'a\n1\n').status_code,
+                         status.HTTP_404_NOT_FOUND)
+        response = self.client.post(reverse('import-table'), {}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SchemaChangeTests(APITestCase):
+    def test_single_alter(self):
+        id = DynamicModel().create_model({"make": "c", "year": "i", "valid": "b", "old": "c"})
+        model_cls = DynamicModel(id).as_model()
+        model_cls.objects.create(make="toyota", year=2012, valid=True)
+
+        new_fields = {"make": "c", "year": "c", "valid": "i", "color": "c", "doors": "i"}
+        with CaptureQueriesContext(connection) as queries:
+            DynamicModel(id).update_model(dict(new_fields))
+
+        alters = [query['sql'] for query in queries if query['sql'].startswith('ALTER TABLE')]
+        if connection.vendor == 'postgresql':
+            self.assertEqual(len(alters), 1)
+
+        fields = DynamicField.objects.filter(table_def_id=id).values_list('name', 'fld_type')
+        self.assertEqual(dict(fields), new_fields)
+
+        row = DynamicModel(id).as_model().objects.values().get()
+        self.assertEqual(row, {"id": row['id'], "make": "toyota", "year": "2012", "valid": 1,
+                               "color": None, "doors": None})
+
+    def test_failed_conversion(self):
+        response = self.client.post(reverse('create-table'), {"make": "character"}, format='json')
+        id = response.data['id']
+        self.client.post(reverse('create-row', args=[id]), {"make": "toyota"}, format='json')
+
+        response = self.client.put(reverse('update-table', args=[id]), {"make": "integer"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(DynamicField.objects.get(table_def_id=id).fld_type, 'c')
+
+
+@skipUnless(connection.vendor == 'postgresql', 'online type change is PostgreSQL only')
+class OnlineTypeChangeTests(APITestCase):
+    def setUp(self):
+        indexes = [{"fields": ["year"], "unique": True}]
+        self.id = DynamicModel().create_model({"make": "c", "year": "c"}, indexes)
+        self.model_cls = DynamicModel(self.id).as_model()
+        rows = [self.model_cls(make=f'make{i}', year=str(2000 + i)) for i in range(5)]
+        self.model_cls.objects.bulk_create(rows)
+
+    def test_online_change(self):
+        dm = dict(settings.DYNAMIC_MODELS, ONLINE_BACKFILL_CHUNK=2)
+        update_url = reverse('update-table', args=[self.id]) + '?online=true'
+        with self.settings(DYNAMIC_MODELS=dm):
+            response = self.client.put(update_url, {"make": "character", "year": "integer"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        migration = DynamicColumnMigration.objects.get(table_def_id=self.id)
+        self.assertEqual((migration.state, migration.last_id), ('done', migration.max_id))
+
+        rows = DynamicModel(self.id).as_model().objects.order_by('id').values_list('year', flat=True)
+        self.assertEqual(list(rows), [2000, 2001, 2002, 2003, 2004])
+        self.assertEqual(table_indexes(self.id), {('year',): True})
+
+    def test_resume(self):
+        mdl = DynamicModel(self.id)
+        online = OnlineColumnMigration.start(mdl, 'year', 'c', 'i')
+
+        # rows written while migration is pending are converted by trigger
+        self.model_cls.objects.create(make='mazda', year='2018')
+        self.assertEqual(DynamicModel.resume_column_migrations(), 1)
+
+        online.migration.refresh_from_db()
+        self.assertEqual(online.migration.state, 'done')
+        rows = DynamicModel(self.id).as_model().objects.order_by('id').values_list('year', flat=True)
+        self.assertEqual(list(rows)[-1], 2018)
+
+    def test_failed_change(self):
+        self.model_cls.objects.create(make='mazda', year='unknown')
+
+        # rest of the change stays applied and new indexes are built
+        datamodel = {"make": "character", "year": "integer", "color": "character", "__indexes__": ["make"]}
+        response = self.client.put(reverse('update-table', args=[self.id]) + '?online=true', datamodel,
+                                   format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        migration = DynamicColumnMigration.objects.get(table_def_id=self.id)
+        self.assertEqual(migration.state, 'failed')
+        columns = {'make': 'character', 'year': 'character', 'color': 'character'}
+        self.assertEqual(response.data['columns'], columns)
+        self.assertEqual(response.data['indexes'], [{'fields': ['make'], 'unique': False}])
+        self.assertEqual([(e['column'], e['migration'], e['state']) for e in response.data['errors']],
+                         [('year', migration.id, 'failed')])
+        self.assertEqual(DynamicField.objects.get(table_def_id=self.id, name='year').fld_type, 'c')
+
+        with connection.cursor() as cursor:
+            columns = connection.introspection.get_table_description(cursor, f'dyntbl_{self.id}')
+        self.assertEqual([column.name for column in columns], ['id', 'make', 'year', 'color'])
+        self.assertEqual(table_indexes(self.id), {('make',): False})
+
+
+def table_indexes(id):
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, f'dyntbl_{id}')
+
+    return {
+        tuple(c['columns']): c['unique']
+        for c in constraints.values() if (c['index'] or c['unique']) and not c['primary_key']
+    }
+
+
+class IndexTests(APITestCase):
+    datamodel = {
+        "make": "character",
+        "model": "character",
+        "year": "integer",
+        "__indexes__": ["year", ["make", "model"], {"fields": ["model"], "unique": True}],
+    }
+
+    def test_create_update(self):
+        response = self.client.post(reverse('create-table'), self.datamodel, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        id = response.data['id']
+        self.assertEqual(table_indexes(id), {('year',): False, ('make', 'model'): False, ('model',): True})
+        self.assertEqual(DynamicIndex.objects.filter(table_def_id=id).count(), 3)
+
+        # removed column takes its indexes away, retyped column keeps them
+        update_url = reverse('update-table', args=[id])
+        response = self.client.put(update_url, {"make": "character", "year": "character"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(table_indexes(id), {('year',): False})
+
+        datamodel = {"make": "character", "year": "character"}
+        datamodel['__indexes__'] = [{"fields": ["make"], "unique": True}]
+        response = self.client.put(update_url, datamodel, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(table_indexes(id), {('make',): True})
+        indexes = DynamicIndex.objects.filter(table_def_id=id).values_list('fields', flat=True)
+        self.assertEqual(list(indexes), [['make']])
+
+        rows_url = reverse('list-rows', args=[id])
+        response = self.client.post(rows_url, [{"make": "toyota"}, {"make": "toyota"}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1])
+
+    def test_failed_unique_index(self):
+        id = self.client.post(reverse('create-table'), self.datamodel, format='json').data['id']
+        rows_url = reverse('list-rows', args=[id])
+        self.client.post(rows_url, [{"make": "toyota", "year": 2012}, {"make": "toyota", "year": 2012}],
+                         format='json')
+
+        datamodel = {"make": "character", "year": "integer", "color": "character",
+                     "__indexes__": ["year", {"fields": ["make"], "unique": True}]}
+        response = self.client.put(reverse('update-table', args=[id]), datamodel, format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        columns = {'make': 'character', 'year': 'integer', 'color': 'character'}
+        self.assertEqual(response.data['columns'], columns)
+        self.assertEqual(response.data['indexes'], [{'fields': ['year'], 'unique': False}])
+        errors = [(error['index'], error['unique']) for error in response.data['errors']]
+        self.assertEqual(errors, [(['make'], True)])
+
+        # table matches reported definition and stays usable
+        self.assertEqual(table_indexes(id), {('year',): False})
+        with connection.cursor() as cursor:
+            columns = connection.introspection.get_table_description(cursor, f'dyntbl_{id}')
+        self.assertEqual([column.name for column in columns], ['id', 'make', 'year', 'color'])
+        response = self.client.post(rows_url, [{"make": "toyota", "color": "red"}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_unique_violation(self):
+        # without group commit every write path reports violation as validation error
+        id = self.client.post(reverse('create-table'), self.datamodel, format='json').data['id']
+        rows_url = reverse('list-rows', args=[id])
+        create_url = reverse('create-row', args=[id])
+        self.client.post(create_url, {"make": "toyota", "model": "corolla"}, format='json')
+        for url in (create_url, reverse('async-create-row', args=[id])):
+            response = self.client.post(url, {"make": "toyota", "model": "corolla"}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('non_field_errors', response.json()['error'])
+
+        self.client.post(create_url, {"make": "mazda", "model": "cx-5"}, format='json')
+        for params in ('?all=true', '?all=true&batch_size=10'):
+            response = self.client.patch(rows_url + params, {"model": "cx-5"}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('non_field_errors', response.data['error'])
+
+        self.assertEqual([row['model'] for row in self.client.get(rows_url).data], ['corolla', 'cx-5'])
+        self.assertEqual(DynamicTable.objects.get(id=id).data_version, 2)
+
+        # batch written before violation stays
+        response = self.client.patch(rows_url + '?all=true&batch_size=1', {"model": "mx-5"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual((response.data['updated'], response.data['batches']), (1, 1))
+        response = self.client.get(rows_url, {'ordering': 'id'})
+        self.assertEqual([row['model'] for row in response.data], ['mx-5', 'cx-5'])
+        self.assertEqual(DynamicTable.objects.get(id=id).data_version, 3)
+
+    def test_errors(self):
+        for indexes in ("year", ["color"], [["make", "make"]], [{"unique": True}]):
+            datamodel = dict(self.datamodel, __indexes__=indexes)
+            response = self.client.post(reverse('create-table'), datamodel, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.assertFalse(DynamicTable.objects.exists())
+
+
+@skipUnless(connection.vendor == 'postgresql', 'concurrent index build is PostgreSQL only')
+class ConcurrentIndexTests(TransactionTestCase):
+    def test_concurrent_build(self):
+        mdl = DynamicModel()
+        id = mdl.create_model({"make": "c", "year": "i"})
+
+        with CaptureQueriesContext(connection) as queries:
+            DynamicModel(id).update_model({"make": "c", "year": "i"}, [{"fields": ["make"], "unique": True}])
+
+        self.assertTrue(any('CONCURRENTLY' in query['sql'] for query in queries))
+        self.assertEqual(table_indexes(id), {('make',): True})
+
+        mdl.model_class = DynamicModel(id).as_model()
+        mdl._delete_table()
+
+    def test_failed_build(self):
+        mdl = DynamicModel()
+        id = mdl.create_model({"make": "c", "year": "i"})
+        DynamicModel(id).as_model().objects.create(make='toyota')
+        DynamicModel(id).as_model().objects.create(make='toyota')
+
+        # columns are committed before indexes are built, failed index is reported, not rolled back with them
+        datamodel = {"make": "character", "year": "integer", "color": "character",
+                     "__indexes__": [{"fields": ["make"], "unique": True}, "year"]}
+        update_url = reverse('update-table', args=[id])
+        response = self.client.put(update_url, datamodel, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual([error['index'] for error in response.json()['errors']], [['make']])
+        self.assertEqual(table_indexes(id), {('year',): False})
+        self.assertEqual(list(DynamicIndex.objects.filter(table_def_id=id).values_list('fields', flat=True)),
+                         [['year']])
+        self.assertIn('color', [field.name for field in DynamicModel(id).as_model()._meta.fields])
+
+        mdl.model_class = DynamicModel(id).as_model()
+        mdl._delete_table()
+
+
+@skipUnless(connection.vendor == 'postgresql', 'SQLite test database does not support concurrent writes')
+@override_settings(DYNAMIC_MODELS=dict(
+    settings.DYNAMIC_MODELS, GROUP_COMMIT=True, GROUP_COMMIT_MAX_ROWS=8, GROUP_COMMIT_MAX_DELAY_MS=2000
+))
+class ConcurrentGroupCommitTests(TransactionTestCase):
+    def setUp(self):
+        indexes = [{"fields": ["model"], "unique": True}]
+        self.id = DynamicModel().create_model({"make": "c", "model": "c"}, indexes)
+
+    def tearDown(self):
+        mdl = DynamicModel(self.id)
+        mdl.as_model()
+        mdl._delete_table()
+
+    def test_one_batch(self):
+        create_url = reverse('create-row', args=[self.id])
+        responses = [None] * 8
+
+        def post(pos):
+            try:
+                # first and last row have the same model
+                row = {"make": "toyota", "model": f"model{pos % 7}"}
+                responses[pos] = Client().post(create_url, row, content_type='application/json')
+            finally:
+                connections.close_all()
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=post, args=(pos,)) for pos in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # full batch doesn't wait for max delay, all rows are written with one data version bump
+        self.assertLess(time.perf_counter() - started, 2)
+        self.assertEqual(sorted(response.status_code for response in responses), [201] * 7 + [400])
+        ids = {response.json()['id'] for response in responses if response.status_code == 201}
+        self.assertEqual(len(ids), 7)
+        self.assertEqual(DynamicTable.objects.get(id=self.id).data_version, 1)
+
+    async def test_async(self):
+        dm = dict(settings.DYNAMIC_MODELS, GROUP_COMMIT=True, GROUP_COMMIT_MAX_DELAY_MS=1)
+        with self.settings(DYNAMIC_MODELS=dm):
+            response = await self.async_client.post(reverse('async-create-row', args=[self.id]),
+                                                    {"make": "mazda"}, content_type='application/json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json(), {'id': 1})
+
+
+# replicas can't hold tables, so they are not shards
+SHARD_ALIASES = [alias for alias in settings.DATABASES if not is_replica(alias)]
+
+
+@skipUnless(len(SHARD_ALIASES) > 1, 'needs shard databases, see SHARD_URLS setting')
+@override_settings(DYNAMIC_MODELS=dict(settings.DYNAMIC_MODELS, SHARDS=SHARD_ALIASES))
+class ShardingTests(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        definitions = [({"make": "c", "year": "i"}, ["year"], None)] * len(SHARD_ALIASES)
+        self.ids = DynamicModel.create_models(definitions)
+
+    def tearDown(self):
+        for id in self.ids:
+            mdl = DynamicModel(id)
+            mdl.as_model()
+            mdl._delete_table()
+
+    def tables(self, alias):
+        return {name for name in connections[alias].introspection.table_names() if name.startswith('dyntbl_')}
+
+    def test_placement(self):
+        placement = dict(DynamicTable.objects.filter(id__in=self.ids).values_list('id', 'shard'))
+        self.assertEqual(sorted(placement.values()), sorted(SHARD_ALIASES))
+
+        for id, shard in placement.items():
+            self.assertIn(f'dyntbl_{id}', self.tables(shard))
+            rows_url = reverse('list-rows', args=[id])
+            rows = [{"make": "toyota", "year": 2012}, {"make": "mazda", "year": 2018}]
+            self.client.post(rows_url, json.dumps(rows), content_type='application/json')
+            self.client.patch(rows_url + '?make=mazda', json.dumps({"year": 2019}),
+                              content_type='application/json')
+
+            response = self.client.get(rows_url, {'ordering': 'year'})
+            self.assertEqual([row['year'] for row in response.json()], [2012, 2019])
+            self.assertEqual(DynamicModel(id).as_model().objects.using(shard).count(), 2)
+
+        for shard in SHARD_ALIASES:
+            self.assertEqual(len(self.tables(shard) & {f'dyntbl_{id}' for id in self.ids}), 1)
+
+    def test_request_queries(self):
+        # queries on shard of the table are counted with the ones on default database
+        id, shard = DynamicTable.objects.exclude(shard='default').values_list('id', 'shard')[0]
+        rows_url = reverse('list-rows', args=[id])
+        request_queries = REQUEST_QUERIES._values.get((('view', 'list-rows'),), [0, 0, 0])[1]
+
+        with CaptureQueriesContext(connection) as queries:
+            with CaptureQueriesContext(connections[shard]) as shard_queries:
+                self.client.get(rows_url)
+
+        self.assertTrue(shard_queries)
+        self.assertEqual(REQUEST_QUERIES._values[(('view', 'list-rows'),)][1] - request_queries,
+                         len(queries) + len(shard_queries))
+
+    def test_update_rolled_back(self):
+        class FailingModel(DynamicModel):
+            def _apply_plan(self, *args):
+                super()._apply_plan(*args)
+                raise DatabaseError('metadata update failed')
+
+        id, shard = DynamicTable.objects.exclude(shard='default').values_list('id', 'shard').first()
+
+        with self.assertRaises(DatabaseError):
+            FailingModel(id).update_model({"make": "c", "year": "i", "color": "c"})
+
+        with connections[shard].cursor() as cursor:
+            columns = connections[shard].introspection.get_table_description(cursor, f'dyntbl_{id}')
+        self.assertNotIn('color', [column.name for column in columns])
+
+        DynamicModel(id).update_model({"make": "c", "year": "i", "color": "c"})
+        self.assertEqual(DynamicField.objects.filter(table_def_id=id).count(), 3)
+
+    def test_move(self):
+        id = self.ids[0]
+        mdl = DynamicModel(id)
+        mdl.as_model()
+        source = mdl.shard
+        target = next(alias for alias in SHARD_ALIASES if alias != source)
+
+        rows_url = reverse('list-rows', args=[id])
+        rows = [{"make": f"make{i}", "year": 2000 + i} for i in range(5)]
+        self.client.post(rows_url, json.dumps(rows), content_type='application/json')
+        before = self.client.get(rows_url).json()
+
+        dm = dict(settings.DYNAMIC_MODELS, BULK_CHUNK_SIZE=2)
+        with self.settings(DYNAMIC_MODELS=dm):
+            self.assertEqual(DynamicModel(id).move_to(target), 5)
+
+        self.assertNotIn(f'dyntbl_{id}', self.tables(source))
+        self.assertIn(f'dyntbl_{id}', self.tables(target))
+        self.assertEqual(self.client.get(rows_url).json(), before)
+
+        response = self.client.post(reverse('create-row', args=[id]), json.dumps({"make": "new"}),
+                                    content_type='application/json')
+        self.assertEqual(response.json()['id'], 6)
+
+        # indexes go with the table
+        response = self.client.put(reverse('update-table', args=[id]), json.dumps({"make": "character"}),
+                                   content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        with self.assertRaises(ValueError):
+            DynamicModel(id).move_to(target)
+        with self.assertRaises(ValueError):
+            DynamicModel(id).move_to('unknown')
+
+
+@override_settings(DYNAMIC_MODELS=dict(settings.DYNAMIC_MODELS, REPLICAS={'default': ['replica1']}))
+class ReadRoutingTests(APITestCase):
+    def tearDown(self):
+        pin(False)
+
+    def test_read_alias(self):
+        pin(False)
+        self.assertEqual(read_alias('default'), 'replica1')
+        self.assertEqual(read_alias('default', timezone.now() - timedelta(hours=1)), 'replica1')
+        self.assertEqual(read_alias('default', timezone.now()), 'default')
+        self.assertEqual(read_alias('shard1'), 'shard1')
+        self.assertTrue(is_replica('replica1'))
+
+        pin()
+        self.assertEqual(read_alias('default'), 'default')
+
+    def test_pinned_after_write(self):
+        self.client.get(reverse('api-list'))
+        self.assertFalse(is_pinned())
+
+        response = self.client.post(reverse('create-table'), {"make": "character"}, format='json')
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        # test client sends the cookie back
+        self.client.get(reverse('api-list'))
+        self.assertTrue(is_pinned())
+
+        self.client.cookies.clear()
+        self.client.get(reverse('api-list'))
+        self.assertFalse(is_pinned())
+
+
+@skipUnless(settings.DYNAMIC_MODELS['REPLICAS'].get('default'), 'needs replica database, see REPLICA_URLS')
+class ReplicaTests(TransactionTestCase):
+    databases = '__all__'
+
+    def test_read_from_replica(self):
+        replica = settings.DYNAMIC_MODELS['REPLICAS']['default'][0]
+        id = DynamicModel().create_model({"make": "c", "year": "i"})
+        rows_url = reverse('list-rows', args=[id])
+        rows = [{"make": "mazda", "year": 2018}]
+        self.client.post(rows_url, json.dumps(rows), content_type='application/json')
+
+        with CaptureQueriesContext(connections[replica]) as queries:
+            self.assertEqual(len(self.client.get(rows_url).json()), 1)
+        self.assertFalse([q for q in queries if 'dyntbl_' in q['sql']])
+
+        # other client long after the write
+        DynamicTable.objects.filter(id=id).update(changed=timezone.now() - timedelta(hours=1))
+        model_cache.clear()
+        caches['responses'].clear()
+        self.client.cookies.clear()
+
+        with CaptureQueriesContext(connections[replica]) as queries:
+            self.assertEqual(len(self.client.get(rows_url).json()), 1)
+        self.assertTrue([q for q in queries if 'api_dynamicfield' in q['sql']])
+        self.assertTrue([q for q in queries if 'dyntbl_' in q['sql']])
+
+        mdl = DynamicModel(id)
+        mdl.as_model()
+        mdl._delete_table()
+
+
+class ModelCacheTests(APITestCase):
+    datamodel = {"make": "c", "year": "i"}
+
+    def setUp(self):
+        model_cache.clear()
+
+    def test_cached_model(self):
+        id = DynamicModel().create_model(dict(self.datamodel))
+
+        with self.assertNumQueries(1):
+            model_cls = DynamicModel(id).as_model()
+
+        self.assertIs(DynamicModel(id).as_model(), model_cls)
+        self.assertEqual(model_cache.stats()['hits'], 2)
+
+    def test_update_invalidates(self):
+        id = DynamicModel().create_model(dict(self.datamodel))
+        old_cls = DynamicModel(id).as_model()
+
+        DynamicModel(id).update_model({"make": "c", "year": "c", "valid": "b"})
+        new_cls = DynamicModel(id).as_model()
+
+        self.assertIsNot(new_cls, old_cls)
+        self.assertEqual(new_cls._meta.get_field('year').get_internal_type(), 'CharField')
+        self.assertEqual(model_cache.stats()['misses'], 1)
+
+    def test_cached_serializer(self):
+        id = DynamicModel().create_model(dict(self.datamodel))
+        serializer_cls = DynamicModel(id).as_serializer()
+        self.assertIs(DynamicModel(id).as_serializer(), serializer_cls)
+
+        serializer = serializer_cls(data={"make": "mazda", "year": "x"})
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('year', serializer.errors)
+        self.assertIsNot(serializer_cls(data={}).fields['make'], serializer.fields['make'])
+
+        DynamicModel(id).update_model({"make": "c"})
+        new_serializer_cls = DynamicModel(id).as_serializer()
+        self.assertIsNot(new_serializer_cls, serializer_cls)
+        self.assertNotIn('year', new_serializer_cls(data={}).fields)
+
+    def test_release_keeps_newer_class(self):
+        id = DynamicModel().create_model(dict(self.datamodel))
+        DynamicModel(id).as_model()
+
+        # newer class built by other request before the cached one is dropped
+        mdl = DynamicModel(id)
+        mdl._build_model_cls(*mdl._read_definition('default'))
+        model_cache.invalidate(id)
+
+        self.assertIs(model_registry.apps.all_models['api'].get(mdl.model_name), mdl.model_class)
+        model_registry.unregister(mdl.model_class)
+
+    def test_schema_changed_by_other_worker(self):
+        id = DynamicModel().create_model(dict(self.datamodel))
+        old_cls = DynamicModel(id).as_model()
+
+        # simulates update done in other process, local cache is not touched
+        DynamicField.objects.create(name='valid', fld_type='b', table_def_id=id)
+        DynamicTable.objects.filter(id=id).update(schema_version=F('schema_version') + 1)
+
+        self.assertEqual(DynamicModel.revalidate([id]), [id])
+        new_cls = DynamicModel(id).as_model()
+        self.assertIsNot(new_cls, old_cls)
+        self.assertIn('valid', [f.name for f in new_cls._meta.fields])
+
+    def test_warm_up(self):
+        ids = [DynamicModel().create_model(dict(self.datamodel), ["year"]) for _ in range(3)]
+        DynamicTable.objects.filter(id=ids[0]).update(last_used=None)
+        model_cache.clear()
+
+        with self.assertNumQueries(3):
+            self.assertEqual(DynamicModel.warm_up(limit=2), 2)
+
+        self.assertEqual(model_cache.stats()['size'], 2)
+        mdl = DynamicModel(ids[2])
+        with self.assertNumQueries(1):
+            mdl.as_serializer()
+        self.assertEqual(model_cache.stats()['hits'], 1)
+        self.assertEqual(len(mdl.model_class._meta.indexes), 1)
+
+    def test_eviction(self):
+        dm = dict(settings.DYNAMIC_MODELS, MODEL_CACHE_SIZE=1)
+        with self.settings(DYNAMIC_MODELS=dm):
+            first = DynamicModel().create_model(dict(self.datamodel))
+            DynamicModel().create_model(dict(self.datamodel))
+            DynamicModel(first).as_model()
+
+        stats = model_cache.stats()
+        self.assertEqual(stats['size'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['evictions'], 2)
+
+    def test_registry_bounded(self):
+        dm = dict(settings.DYNAMIC_MODELS, MODEL_CACHE_SIZE=2)
+        with self.settings(DYNAMIC_MODELS=dm), warnings.catch_warnings():
+            warnings.simplefilter('error', RuntimeWarning)
+
+            ids = [DynamicModel().create_model(dict(self.datamodel)) for _ in range(4)]
+            for _ in range(3):
+                DynamicModel(ids[-1]).update_model({"make": "c", "year": "c"})
+                DynamicModel(ids[-1]).update_model({"make": "c", "year": "i"})
+                DynamicModel(ids[-1]).as_model()
+
+        stats = model_cache.stats()
+        self.assertEqual(stats['size'], 2)
+        self.assertEqual(stats['registry']['models'], 2)
+        self.assertFalse([name for name in apps.all_models['api'] if name.startswith('dyntbl_')])
+
+    def test_registry_admin(self):
+        id = DynamicModel().create_model(dict(self.datamodel))
+        mdl = DynamicModel(id)
+        mdl.register_admin()
+        old_cls = mdl.model_class
+
+        DynamicModel(id).update_model({"make": "c", "year": "c"})
+        new_cls = DynamicModel(id).as_model()
+
+        self.assertFalse(admin.site.is_registered(old_cls))
+        self.assertTrue(admin.site.is_registered(new_cls))
+        self.assertEqual(model_registry.stats()['admin_models'], 1)
+
+        model_cache.clear()
+        self.assertFalse(admin.site.is_registered(new_cls))
+
+
+class BenchmarkTests(APITestCase):
+    def test_run(self):
+        results = Benchmark(tables=2, columns=4, rows=10, single_rows=3).run()
+
+        self.assertEqual(results['meta']['vendor'], connection.vendor)
+        for name, summary in results['results'].items():
+            self.assertEqual(summary['errors'], 0, summary.get('first_error'))
+        self.assertEqual(results['results']['create_row']['count'], 3)
+        self.assertEqual(results['results']['create_row_grouped']['count'], 3)
+        self.assertEqual(results['results']['list_rows']['count'], 2)
+        self.assertEqual(results['results']['search']['count'], 2)
+        self.assertEqual(results['results']['as_model']['queries_per_op'], 1)
+
+    def test_compare(self):
+        baseline = {'results': {'list_rows': {'p50_ms': 10, 'rows_per_sec': 1000, 'queries_per_op': 2}}}
+        results = {'results': {
+            'list_rows': {'p50_ms': 11, 'rows_per_sec': 700, 'queries_per_op': 3},
+            'create_row': {'p50_ms': 50},
+        }}
+
+        self.assertEqual(compare(results, baseline, 0.2), [
+            'list_rows.queries_per_op: 2 -> 3', 'list_rows.rows_per_sec: 1000 -> 700'
+        ])
+        self.assertEqual(compare(results, baseline, 0.5), [])
+
+    @override_settings(ALLOWED_HOSTS=[])
+    def test_benchmark_rows(self):
+        output = io.StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('benchmark_rows', rows=20, repeat=2, stdout=output)
+
+        self.assertIn('list: serializer', output.getvalue())
+        # every run reads rows, none of them is answered from response cache
+        self.assertEqual(len([q for q in queries if 'FROM "dyntbl_' in q['sql']]), 8)
+
+
+class MetricsTests(APITestCase):
+    def test_metrics(self):
+        response = self.client.post(reverse('create-table'), {"make": "character"}, format='json')
+        rows_url = reverse('list-rows', args=[response.data['id']])
+        self.client.post(rows_url, [{"make": "toyota"}, {"make": "mazda"}], format='json')
+        self.client.get(rows_url)
+
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+        lines = response.content.decode().splitlines()
+        self.assertIn('# TYPE dynmodel_ddl_seconds histogram', lines)
+        # metrics are process wide, other tests add to them too
+        names = {line.split(' ')[0] for line in lines}
+        for name in ('dynmodel_ddl_seconds_count{operation="create_table"}',
+                     'dynmodel_request_queries_count{view="list-rows"}',
+                     'dynmodel_rows_served_total', 'dynmodel_model_cache_hits_total'):
+            self.assertIn(name, names)
+
+
+class AsyncViewsTests(APITestCase):
+    def setUp(self):
+        datamodel = {"make": "character", "year": "integer"}
+        self.id = self.client.post(reverse('create-table'), datamodel, format='json').data['id']
+
+    def test_create_and_list(self):
+        create_url = reverse('async-create-row', args=[self.id])
+        for row in ({"make": "toyota", "year": 2012}, {"make": "mazda", "year": 2018}):
+            response = self.client.post(create_url, row, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response = self.client.post(create_url, {"year": "x"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('year', response.json()['error'])
+
+        for params in ({}, {'year__gte': 2015, 'ordering': '-year'}):
+            sync_response = self.client.get(reverse('list-rows', args=[self.id]), params)
+            async_response = self.client.get(reverse('async-list-rows', args=[self.id]), params)
+            self.assertEqual(async_response.status_code, status.HTTP_200_OK)
+            self.assertEqual(async_response.content, sync_response.content)
+
+        # pagination is passed to sync view
+        response = self.client.get(reverse('async-list-rows', args=[self.id]), {'page_size': 1})
+        self.assertEqual(response.json()['results'], [{'id': 1, 'make': 'toyota', 'year': 2012}])
+
+        response = self.client.get(reverse('async-list-rows', args=[self.id]), {'color': 'red'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_not_found(self):
+        response = self.client.post(reverse('async-create-row', args=[0]), {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(reverse('async-list-rows', args=[0]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
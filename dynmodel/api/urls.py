@@ -1,10 +1,19 @@
 from django.urls import path
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     path('', views.api_root, name='api-list'),
     path('table/', views.create_table, name='create-table'),
+    path('tables/', views.create_tables, name='create-tables'),
+    path('table/import/', views.import_table, name='import-table'),
     path('table/<int:id>/', views.update_table, name='update-table'),
     path('table/<int:id>/row/', views.create_row, name='create-row'),
-    path('table/<int:id>/rows/', views.list_rows, name='list-rows'),
+    path('table/<int:id>/rows/', views.table_rows, name='list-rows'),
+    path('table/<int:id>/aggregate/', views.aggregate_table, name='aggregate-table'),
+    path('table/<int:id>/search/', views.search_table, name='search-table'),
+    path('table/<int:id>/export/', views.export_table, name='export-table'),
+    path('table/<int:id>/import/', views.import_table, name='import-rows'),
+    path('metrics/', views.metrics, name='metrics'),
+    path('async/table/<int:id>/row/', async_views.create_row, name='async-create-row'),
+    path('async/table/<int:id>/rows/', async_views.table_rows, name='async-list-rows'),
 ]
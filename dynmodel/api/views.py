@@ -1,16 +1,33 @@
-from django.contrib import admin
 from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
+from django.core.handlers.asgi import ASGIRequest
+from django.db import DatabaseError, IntegrityError, router, transaction
+from django.http import HttpResponse, StreamingHttpResponse
 
 from rest_framework.decorators import api_view, parser_classes
-from rest_framework.parsers import JSONParser
+from rest_framework.parsers import JSONParser, MultiPartParser
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
 from rest_framework import status
 
+from .aggregates import aggregate_rows
+from .bulk import insert_rows
 from .models import TYPE_DEFINITIONS
-from .serializers import generic_serializer
 from .dynamicmodel import DynamicModel
+from .export import EXPORT_FORMATS, export_columns, export_rows
+from .fastread import plain_columns, represent_rows
+from .filters import filter_rows, has_filters
+from .groupcommit import group_commit
+from .importer import CsvImport
+from .metrics import (
+    ROWS_DELETED, ROWS_INSERTED, ROWS_SERIALIZE_SECONDS, ROWS_SERVED, ROWS_UPDATED, metrics_registry
+)
+from .mutations import delete_rows, update_rows
+from .pagination import RowCursorPagination, SearchPagination
+from .responsecache import cached_response, not_modified
+from .parsers import NDJSONParser
+from .search import search_rows
+from .streaming import ndjson_rows
 
 
 @api_view(['GET'])
@@ -18,11 +35,54 @@ def api_root(request, format=None):
     return Response({
         'update table': reverse('update-table', request=request, args=[1]),
         'create table': reverse('create-table', request=request, format=format),
+        'create tables': reverse('create-tables', request=request, format=format),
         'create row': reverse('create-row', request=request, format=format, args=[1]),
         'list rows': reverse('list-rows', request=request, format=format, args=[1]),
+        'insert rows': reverse('list-rows', request=request, format=format, args=[1]),
+        'aggregate table': reverse('aggregate-table', request=request, format=format, args=[1]),
+        'search table': reverse('search-table', request=request, format=format, args=[1]),
+        'export table': reverse('export-table', request=request, format=format, args=[1]),
+        'import table': reverse('import-table', request=request, format=format),
+        'import rows': reverse('import-rows', request=request, format=format, args=[1]),
+        'metrics': reverse('metrics', request=request),
     })
 
 
+def table_not_found_error(id: int) -> dict:
+    return {'error': f'Table with id "{id}" does not exisits'}
+
+
+def table_not_found(id: int) -> Response:
+    return Response(table_not_found_error(id), status=status.HTTP_404_NOT_FOUND)
+
+
+def is_true(value: str) -> bool:
+    return value is not None and value.lower() in ('1', 'true', 'yes')
+
+
+# key with list of indexes in table definition, column names with '__' are rejected by parse_datamodel
+INDEXES_KEY = '__indexes__'
+# key with list of searchable character columns in table definition
+SEARCH_KEY = '__search__'
+
+
+def is_asgi(request) -> bool:
+    # ASGI handler of Django 4.1 iterates streamed content in event loop, where database can't be queried
+    return isinstance(getattr(request, '_request', request), ASGIRequest)
+
+
+def streaming_not_supported() -> Response:
+    # limitation of server, not error of request
+    return Response({'error': 'streaming is not supported under ASGI, use WSGI server'},
+                    status=status.HTTP_501_NOT_IMPLEMENTED)
+
+
+def save_row(serializer) -> int:
+    # savepoint keeps surrounding transaction usable when row violates unique index
+    with transaction.atomic(using=router.db_for_write(serializer.Meta.model)):
+        return serializer.save().id
+
+
 def convert_type(in_type: str) -> str:
     for typ_id, name in TYPE_DEFINITIONS:
         if name == in_type:
@@ -39,45 +99,106 @@ def convert_input_types(in_type: dict[str, str]) -> dict[str, str]:
     return fields
 
 
+def parse_datamodel(data) -> tuple[dict[str, str], list, list]:
+    if not isinstance(data, dict):
+        raise ValueError('datamodel has to be an object')
+
+    data = dict(data)
+    indexes = data.pop(INDEXES_KEY, None)
+    search = data.pop(SEARCH_KEY, None)
+
+    if not data:
+        raise ValueError('datamodel cannot be empty')
+
+    for name in data:
+        # '__' separates filter lookups and is used by reserved keys and columns, id is primary key
+        if '__' in name or name == 'id':
+            raise ValueError(f'Invalid column name "{name}", "id" and names with "__" are reserved')
+
+    return convert_input_types(data), indexes, search
+
+
 @api_view(['POST'])
 @parser_classes([JSONParser])
 def create_table(request):
     """
     Creates table from json file with 'name': 'type' pairs.
     Allowed types: 'boolean', 'character', 'integer'
+    Optional "__indexes__" lists secondary indexes, each one is column name,
+    list of columns or {"fields": [...], "unique": true}.
+    Optional "__search__" lists character columns of full text search.
     Example:
 
     {
         "make": "character",
         "model": "character",
         "year": "integer",
-        "valid_license": "boolean"
+        "valid_license": "boolean",
+        "__indexes__": ["year", ["make", "model"], {"fields": ["model"], "unique": true}],
+        "__search__": ["make", "model"]
     }
 
     """
-    if not request.data:
-        return Response({'error': 'datamodel cannot be empty'}, status=400)
-
     try:
-        fields = convert_input_types(request.data)
+        fields, indexes, search = parse_datamodel(request.data)
+        mdl = DynamicModel()
+        id = mdl.create_model(fields, indexes, search)
     except ValueError as exc:
         return Response({'error': str(exc)}, status=400)
 
-    mdl = DynamicModel()
-    id = mdl.create_model(fields)
-
     if settings.DYNAMIC_MODELS['REGISTER_MODEL_IN_ADMIN']:
-        admin.site.register(mdl.as_model())
+        mdl.register_admin()
 
     return Response({'id': id}, status=201)
 
 
+@api_view(['POST'])
+@parser_classes([JSONParser])
+def create_tables(request):
+    """
+    Creates many tables at once from json array of datamodels in the same format as for single table.
+    Either all tables are created or none, response lists ids in order of datamodels.
+    Example:
+
+    [
+        {"make": "character", "year": "integer", "__indexes__": ["year"]},
+        {"name": "character", "active": "boolean"}
+    ]
+
+    {"ids": [12, 13]}
+    """
+    if not isinstance(request.data, list) or not request.data:
+        return Response({'error': 'expected non empty array of datamodels'}, status=400)
+
+    definitions = []
+    for index, data in enumerate(request.data):
+        try:
+            definitions.append(parse_datamodel(data))
+        except ValueError as exc:
+            return Response({'error': str(exc), 'index': index}, status=400)
+
+    try:
+        ids = DynamicModel.create_models(definitions)
+    except ValueError as exc:
+        return Response({'error': str(exc)}, status=400)
+
+    if settings.DYNAMIC_MODELS['REGISTER_MODEL_IN_ADMIN']:
+        for id in ids:
+            DynamicModel(id).register_admin()
+
+    return Response({'ids': ids}, status=201)
+
+
 @api_view(['PUT'])
 @parser_classes([JSONParser])
 def update_table(request, id):
     """
     Updates dynamic model table from json file with 'name': 'type' pairs.
     Allowed types: 'boolean', 'character', 'integer'
+    Optional "__indexes__" replaces secondary indexes, without it existing indexes are kept
+    unless their columns are removed.
+    Optional "__search__" replaces searchable columns, without it they are kept while they stay
+    character columns.
     Example:
 
     {
@@ -85,23 +206,35 @@ def update_table(request, id):
         "model": "character",
         "year": "character",
         "make_year": "integer",
-        "licence_valid_year": "integer"
+        "licence_valid_year": "integer",
+        "__indexes__": [{"fields": ["make", "make_year"], "unique": true}],
+        "__search__": ["make", "model"]
     }
 
+    With ?online=true column types are changed without blocking reads and writes of large tables
+    (PostgreSQL only), interrupted change is finished by 'manage.py resume_column_migrations'.
+    Online type changes and new indexes are applied after the rest of the change is committed, when any
+    of them fails 207 is returned with current 'columns' and 'indexes' of table and 'errors' with failed
+    column, its migration id and state, or failed index, e.g. unique one on duplicate values.
     """
-    if not request.data:
-        return Response({'error': 'datamodel cannot be empty'}, status=400)
-
     try:
-        fields = convert_input_types(request.data)
-    except ValueError as exc:
+        fields, indexes, search = parse_datamodel(request.data)
+        online = request.query_params.get('online', str(settings.DYNAMIC_MODELS['ONLINE_TYPE_CHANGE']))
+        online = is_true(online)
+        mdl = DynamicModel(id)
+        errors = mdl.update_model(fields, indexes, online, search)
+    except ObjectDoesNotExist:
+        return table_not_found(id)
+    except (ValueError, DatabaseError) as exc:
+        # existing values which can't be converted to new column type end up here
         return Response({'error': str(exc)}, status=400)
 
-    mdl = DynamicModel(id)
-    mdl.update_model(fields)
-
     if settings.DYNAMIC_MODELS['REGISTER_MODEL_IN_ADMIN']:
-        admin.site.register(mdl.as_model())
+        mdl.register_admin()
+
+    if errors:
+        # rest of the change is committed, definition tells what the table looks like now
+        return Response({'id': id, **mdl.definition(), 'errors': errors}, status=status.HTTP_207_MULTI_STATUS)
 
     return Response({'id': id})
 
@@ -118,30 +251,354 @@ def create_row(request, id):
         "valid_license": true
     }
     """
+    mdl = DynamicModel(id)
     try:
-        model_cls = DynamicModel(id).as_model()
+        serializer_cls = mdl.as_serializer()
     except ObjectDoesNotExist:
-        return Response({'error': 'Table with id "{id}" does not exisits'}, status=status.HTTP_404_NOT_FOUND)
+        return table_not_found(id)
 
-    serializer_cls = generic_serializer(model_cls)
     serializer = serializer_cls(data=request.data)
 
-    if serializer.is_valid():
-        obj = serializer.save()
-        return Response({'id': obj.id}, status=201)
+    if not serializer.is_valid():
+        return Response({'error': serializer.errors}, status=400)
+
+    if settings.DYNAMIC_MODELS['GROUP_COMMIT']:
+        try:
+            id = group_commit.insert(mdl, serializer.validated_data)
+        except DatabaseError as exc:
+            return Response({'error': {'non_field_errors': [str(exc)]}}, status=400)
+    else:
+        try:
+            id = save_row(serializer)
+        except IntegrityError as exc:
+            return Response({'error': {'non_field_errors': [str(exc)]}}, status=400)
+        mdl.bump_data_version()
+
+    ROWS_INSERTED.inc()
+    return Response({'id': id}, status=201)
+
+
+@api_view(['GET', 'POST', 'PATCH', 'DELETE'])
+@parser_classes([JSONParser, NDJSONParser])
+def table_rows(request, id):
+    """
+    GET lists all rows.
+    With ?page_size=N rows are returned in pages ordered by id, follow 'next' link to get next page,
+    pages can't be combined with ?ordering.
+    With ?stream=true rows are streamed as NDJSON, only under WSGI server, under ASGI 501 is returned.
+
+    Rows can be filtered by columns, filters are combined with AND:
+    ?make=toyota, ?year__gte=2010, ?year__lt=2020, ?make__in=toyota,mazda,
+    ?model__isnull=true, ?model__startswith=cx (character columns only).
+    Sort with ?ordering=-year,make
+
+    POST inserts many rows at once, body is JSON array or NDJSON (application/x-ndjson).
+    Invalid rows are reported in 'errors' with their index and skipped,
+    with ?atomic=true any invalid row aborts the whole batch.
+    Example:
+
+    [
+        {"make": "toyota", "model": "corolla", "year": 2012, "valid_license": true},
+        {"make": "mazda", "model": "cx-5", "year": 2018, "valid_license": true}
+    ]
+
+    PATCH sets columns from JSON object on all rows matching filters, DELETE removes them.
+    Both run as single statement and return number of affected rows. Without filters ?all=true
+    is required. With ?batch_size=N rows are written in id ranges of N rows, each in own transaction.
+    Example: PATCH ?year__lt=2000 {"valid_license": false} -> {"updated": 12, "batches": 1}
+
+    GET responses carry ETag of table data version, with matching If-None-Match 304 is returned
+    without reading rows. Listing and aggregate responses are cached until table changes.
+    """
+    mdl = DynamicModel(id)
+    try:
+        serializer_cls = mdl.as_serializer()
+    except ObjectDoesNotExist:
+        return table_not_found(id)
+
+    if request.method == 'POST':
+        return bulk_insert_rows(request, mdl, serializer_cls)
+
+    if request.method in ('PATCH', 'DELETE'):
+        return write_rows_by_filter(request, mdl, serializer_cls)
+
+    if is_true(request.query_params.get('stream')):
+        return not_modified(request, mdl) or list_rows(request, mdl.model_class, serializer_cls)
+
+    return cached_response(request, mdl, lambda: list_rows(request, mdl.model_class, serializer_cls))
+
+
+def list_rows(request, model_cls, serializer_cls) -> Response:
+    try:
+        rows, ordering = filter_rows(model_cls, request.query_params)
+    except ValueError as exc:
+        return Response({'error': str(exc)}, status=400)
+
+    columns = plain_columns(model_cls) if settings.DYNAMIC_MODELS['FAST_READ'] else None
+    if columns:
+        # plain values are the same as serializer output, model instances are not needed
+        rows = rows.values(*columns)
+        serializer_cls = None
+
+    if is_true(request.query_params.get('stream')):
+        if is_asgi(request):
+            return streaming_not_supported()
+
+        content = ndjson_rows(rows.order_by(*ordering, 'id'), serializer_cls)
+        return StreamingHttpResponse(content, content_type='application/x-ndjson')
+
+    paginator = RowCursorPagination()
+    paging = (paginator.page_size_query_param, paginator.cursor_query_param)
+    if ordering and any(param in request.query_params for param in paging):
+        # cursor is position in id order, it can't continue listing sorted by nullable columns
+        return Response({'error': 'ordering can\'t be combined with page_size or cursor'}, status=400)
+
+    page = paginator.paginate_queryset(rows, request)
+    if page is not None:
+        with ROWS_SERIALIZE_SECONDS.time():
+            data = represent_rows(page, serializer_cls)
+        ROWS_SERVED.inc(len(data))
+        return paginator.get_paginated_response(data)
+
+    with ROWS_SERIALIZE_SECONDS.time():
+        data = represent_rows(rows, serializer_cls)
+    ROWS_SERVED.inc(len(data))
+
+    return Response(data)
+
+
+def bulk_insert_rows(request, mdl, serializer_cls) -> Response:
+    if not isinstance(request.data, list):
+        return Response({'error': 'expected array of rows'}, status=400)
+
+    if not request.data:
+        return Response({'error': 'rows cannot be empty'}, status=400)
+
+    atomic = is_true(request.query_params.get('atomic'))
+    result = insert_rows(mdl.model_class, serializer_cls, request.data, atomic=atomic)
+    if result['inserted']:
+        mdl.bump_data_version()
+    ROWS_INSERTED.inc(result['inserted'])
+
+    if not result['errors']:
+        return Response(result, status=201)
+
+    if not result['inserted']:
+        return Response(result, status=400)
+
+    return Response(result, status=status.HTTP_207_MULTI_STATUS)
+
+
+def write_rows_by_filter(request, mdl, serializer_cls) -> Response:
+    params = request.query_params
+    if not has_filters(params) and not is_true(params.get('all')):
+        return Response({'error': 'filter rows or confirm writing all of them with ?all=true'}, status=400)
+
+    batch_size = params.get('batch_size')
+    if batch_size is not None:
+        if not batch_size.isdigit() or int(batch_size) < 1:
+            return Response({'error': 'batch_size must be positive integer'}, status=400)
+        batch_size = int(batch_size)
+
+    try:
+        rows, _ = filter_rows(mdl.model_class, params)
+    except ValueError as exc:
+        return Response({'error': str(exc)}, status=400)
+
+    if request.method == 'DELETE':
+        result = delete_rows(rows, batch_size)
+        if result['rows']:
+            mdl.bump_data_version()
+        ROWS_DELETED.inc(result['rows'])
+        return Response({'deleted': result['rows'], 'batches': result['batches']})
+
+    if not isinstance(request.data, dict) or not request.data:
+        return Response({'error': 'expected object with new column values'}, status=400)
+
+    serializer = serializer_cls(data=request.data, partial=True)
+    writable = {name for name, field in serializer.fields.items() if not field.read_only}
+    unknown = [name for name in request.data if name not in writable]
+    if unknown:
+        return Response({'error': f'Unknown or read only columns: {", ".join(unknown)}'}, status=400)
+
+    if not serializer.is_valid():
+        return Response({'error': serializer.errors}, status=400)
+
+    result = update_rows(rows, serializer.validated_data, batch_size)
+    if result['rows']:
+        mdl.bump_data_version()
+    ROWS_UPDATED.inc(result['rows'])
+
+    data = {'updated': result['rows'], 'batches': result['batches']}
+    if 'error' in result:
+        # rows of batches written before the error stay updated
+        return Response(dict(data, error={'non_field_errors': [result['error']]}), status=400)
+
+    return Response(data)
+
+
+@api_view(['GET'])
+def aggregate_table(request, id):
+    """
+    Aggregates rows in database, with ?group_by=make,valid_license per each combination of values.
+    ?agg lists aggregates, default is row count:
+    count, col__count, col__count_distinct and col__sum, col__min, col__max, col__avg (integer columns).
+    Results are named by the aggregate, rows can be filtered like in rows listing.
+    Sort with ?ordering=-count,make
+
+    Example: ?agg=count,year__avg&group_by=make&year__gte=2010
+
+    {
+        "results": [
+            {"make": "mazda", "count": 2, "year__avg": 2016.5},
+            {"make": "toyota", "count": 1, "year__avg": 2012.0}
+        ]
+    }
+    """
+    mdl = DynamicModel(id)
+    try:
+        model_cls = mdl.as_model()
+    except ObjectDoesNotExist:
+        return table_not_found(id)
+
+    def aggregate():
+        try:
+            return Response({'results': aggregate_rows(model_cls, request.query_params)})
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=400)
+
+    return cached_response(request, mdl, aggregate)
+
+
+@api_view(['GET'])
+def search_table(request, id):
+    """
+    Full text search in searchable columns, matching rows are ordered by rank, best first.
+    ?q is text to search, all its words have to match, on PostgreSQL also "quoted phrase",
+    'or' and -word work. Results come in pages, ?page=2&page_size=50, follow 'next' link to get next page.
+
+    Example: ?q=toyota corolla
+
+    {
+        "next": null,
+        "previous": null,
+        "results": [{"id": 1, "make": "toyota", "model": "corolla", "year": 2012, "rank": 0.06}]
+    }
+    """
+    mdl = DynamicModel(id)
+    try:
+        model_cls = mdl.as_model()
+    except ObjectDoesNotExist:
+        return table_not_found(id)
 
-    return Response({'error': serializer.errors}, status=400)
+    def search():
+        try:
+            rows = search_rows(model_cls, request.query_params.get('q', ''))
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=400)
+
+        columns = [field.name for field in model_cls._meta.concrete_fields]
+        paginator = SearchPagination()
+        with ROWS_SERIALIZE_SECONDS.time():
+            data = paginator.paginate_queryset(rows.values(*columns, 'rank'), request)
+        ROWS_SERVED.inc(len(data))
+
+        return paginator.get_paginated_response(data)
+
+    return cached_response(request, mdl, search)
 
 
 @api_view(['GET'])
-def list_rows(request, id):
+def export_table(request, id):
+    """
+    Streams whole table as CSV file with header or with ?output=ndjson as NDJSON,
+    columns are in order of table definition. With ?compress=gzip file is gzip compressed.
+    Rows can be filtered and ordered like in rows listing, default order is by id.
+    On PostgreSQL data come from COPY, elsewhere from server side cursor. Works only under WSGI server,
+    under ASGI 501 is returned.
+    """
+    if is_asgi(request):
+        return streaming_not_supported()
+
     try:
         model_cls = DynamicModel(id).as_model()
     except ObjectDoesNotExist:
-        return Response({'error': 'Table with id "{id}" does not exisits'}, status=status.HTTP_404_NOT_FOUND)
+        return table_not_found(id)
+
+    output = request.query_params.get('output', 'csv')
+    if output not in EXPORT_FORMATS:
+        return Response({'error': f'Unknown output "{output}", expected one of {", ".join(EXPORT_FORMATS)}'},
+                        status=400)
+
+    compress = request.query_params.get('compress')
+    if compress not in (None, 'gzip'):
+        return Response({'error': f'Unknown compression "{compress}", expected gzip'}, status=400)
+
+    try:
+        rows, ordering = filter_rows(model_cls, request.query_params)
+    except ValueError as exc:
+        return Response({'error': str(exc)}, status=400)
+
+    content = export_rows(rows.order_by(*ordering, 'id'), export_columns(model_cls), output, bool(compress))
+    filename = f'{model_cls._meta.db_table}.{output}' + ('.gz' if compress else '')
+
+    content_type = 'application/gzip' if compress else EXPORT_FORMATS[output]
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+
+    return response
+
+
+@api_view(['POST'])
+@parser_classes([MultiPartParser])
+def import_table(request, id=None):
+    """
+    Imports CSV file uploaded as 'file' field, first line is header with column names.
+    Without table id new table is created, column types are inferred from first rows of file:
+    integer, boolean (true/false, t/f, yes/no) or character. Id column of file is not imported.
+    Into existing table all columns of file must exist in it. Empty values are imported as null.
+    File is read and inserted in chunks, rows which can't be inserted are reported by line number.
+    New table of file which turns out broken after the first rows is dropped again.
+    Other delimiter can be set with ?delimiter=;
+
+    {
+        "id": 12,
+        "schema": {"make": "character", "year": "integer"},
+        "rows": 3, "inserted": 2, "rejected": 1,
+        "errors": [{"line": 3, "errors": {"year": ["A valid integer is required."]}}]
+    }
+    """
+    upload = request.FILES.get('file')
+    if upload is None:
+        return Response({'error': 'CSV file expected in "file" field'}, status=400)
+
+    delimiter = request.query_params.get('delimiter', ',')
+    if len(delimiter) != 1:
+        return Response({'error': 'delimiter must be single character'}, status=400)
+
+    try:
+        csv_import = CsvImport(upload.file, delimiter)
+
+        if id is None:
+            result = csv_import.into_new_table()
+            result['schema'] = {name: dict(TYPE_DEFINITIONS)[typ] for name, typ in result['schema'].items()}
+
+            if settings.DYNAMIC_MODELS['REGISTER_MODEL_IN_ADMIN']:
+                DynamicModel(result['id']).register_admin()
+        else:
+            result = csv_import.into_table(DynamicModel(id))
+    except ObjectDoesNotExist:
+        return table_not_found(id)
+    except ValueError as exc:
+        return Response({'error': str(exc)}, status=400)
+
+    ROWS_INSERTED.inc(result['inserted'])
+
+    return Response(result, status=201 if id is None else 200)
 
-    serializer_cls = generic_serializer(model_cls)
-    rows = model_cls.objects.all()
-    serializer = serializer_cls(rows, many=True)
 
-    return Response(serializer.data)
+def metrics(request):
+    """
+    Histograms and counters of this worker in Prometheus text format.
+    """
+    return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')